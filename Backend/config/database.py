@@ -0,0 +1,65 @@
+# config/database.py
+import os
+import sys
+import asyncio
+from contextlib import asynccontextmanager
+
+from psycopg_pool import AsyncConnectionPool
+
+# psycopg async no funciona con el ProactorEventLoop (default en Windows)
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# Tamaño y tiempos del pool (configurables por variables de entorno)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))   # segundos antes de cerrar conexiones ociosas
+DB_POOL_TIMEOUT  = float(os.getenv("DB_POOL_TIMEOUT", "30"))     # espera máxima para obtener una conexión
+
+_pool: AsyncConnectionPool | None = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool() -> AsyncConnectionPool:
+    """
+    Devuelve el pool async compartido por todas las clases de model/.
+    Se crea y abre la primera vez que se usa (dentro del event loop).
+    """
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    os.getenv("DATABASE_URL", ""),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    timeout=DB_POOL_TIMEOUT,
+                    # health check al entregar la conexión: descarta sockets muertos
+                    check=AsyncConnectionPool.check_connection,
+                    name="bee-organized",
+                    open=False,
+                )
+                await pool.open(wait=False)
+                print(f"✅ Pool PostgreSQL listo (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+                _pool = pool
+    return _pool
+
+
+@asynccontextmanager
+async def connection():
+    """
+    Presta una conexión async del pool durante una operación.
+    Al salir hace commit (o rollback si hubo excepción) y la devuelve al pool.
+    """
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
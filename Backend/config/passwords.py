@@ -0,0 +1,111 @@
+# config/passwords.py
+"""
+Hash y verificación de contraseñas (bcrypt) en un pool de hilos propio y acotado.
+
+bcrypt es CPU pura y lenta a propósito (~0.1-0.3 s por operación): si se corre en el
+threadpool compartido de Starlette, una ráfaga de logins ocupa todos sus hilos y frena
+el resto del CRUD. Acá corre en PWD_HASH_WORKERS hilos con a lo sumo PWD_HASH_QUEUE_MAX
+operaciones esperando; si la cola está llena se rechaza enseguida (PasswordHasherOcupado).
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS      = int(os.getenv("BCRYPT_ROUNDS", "12"))        # costo: al cambiarlo se re-hashea en el login
+PWD_HASH_WORKERS   = int(os.getenv("PWD_HASH_WORKERS", "2"))
+PWD_HASH_QUEUE_MAX = int(os.getenv("PWD_HASH_QUEUE_MAX", "64"))   # operaciones esperando un hilo
+
+
+class PasswordHasherOcupado(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PWD_HASH_WORKERS, queue_max: int = PWD_HASH_QUEUE_MAX):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.workers = max(1, workers)
+        self.limite = self.workers + max(0, queue_max)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._en_vuelo = 0
+        self._stats = {
+            "hash": 0,
+            "verify": 0,
+            "rechazadas": 0,
+            "max_en_vuelo": 0,
+            "espera_seconds": 0.0,   # tiempo en cola antes de tomar un hilo
+            "cpu_seconds": 0.0,      # tiempo dentro de bcrypt
+        }
+
+    # -------- helpers síncronos (no tocan el pool) --------
+    def es_hash(self, valor: str | None) -> bool:
+        """True si el valor guardado es un hash reconocido (y no una contraseña en texto plano)."""
+        try:
+            return bool(valor) and self.context.identify(valor) is not None
+        except Exception:
+            return False
+
+    def necesita_rehash(self, hashed: str) -> bool:
+        return self.context.needs_update(hashed)
+
+    # -------- operaciones en el pool --------
+    async def _run(self, op: str, fn, *args):
+        if self._en_vuelo >= self.limite:
+            self._stats["rechazadas"] += 1
+            raise PasswordHasherOcupado("Demasiadas operaciones de contraseña en cola")
+
+        self._en_vuelo += 1
+        self._stats["max_en_vuelo"] = max(self._stats["max_en_vuelo"], self._en_vuelo)
+        encolado = time.perf_counter()
+        tiempos = []
+
+        def medir():
+            inicio = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                tiempos.append((inicio - encolado, time.perf_counter() - inicio))
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, medir)
+        finally:
+            self._en_vuelo -= 1
+            self._stats[op] += 1
+            if tiempos:
+                self._stats["espera_seconds"] += tiempos[0][0]
+                self._stats["cpu_seconds"] += tiempos[0][1]
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """False si no coincide o si el hash guardado es inválido."""
+        try:
+            return bool(await self._run("verify", self.context.verify, password, hashed))
+        except PasswordHasherOcupado:
+            raise
+        except Exception:
+            return False
+
+    def metrics(self) -> Dict[str, Any]:
+        st = dict(self._stats)
+        ops = (st["hash"] + st["verify"]) or 1
+        st.update({
+            "workers": self.workers,
+            "limite": self.limite,
+            "en_vuelo": self._en_vuelo,
+            "rounds": self.context.to_dict().get("bcrypt__rounds"),
+            "avg_espera_ms": st["espera_seconds"] / ops * 1000.0,
+            "avg_cpu_ms": st["cpu_seconds"] / ops * 1000.0,
+        })
+        return st
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instancia compartida (una por proceso)
+PWD_HASHER = PasswordHasher()
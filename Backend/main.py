@@ -1,38 +1,54 @@
 import os
 import io
+import asyncio
+import base64
 import csv
 import json
+import hashlib
+import hmac
 import re
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
-from collections import defaultdict
-from statistics import pstdev
 from datetime import datetime, timedelta, date
 
+import numpy as np
+
 from fastapi import FastAPI, Response, HTTPException, UploadFile, File, Header, Depends
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from starlette.status import (
     HTTP_200_OK, 
     HTTP_201_CREATED, 
+    HTTP_202_ACCEPTED,
     HTTP_204_NO_CONTENT, 
     HTTP_409_CONFLICT, 
     HTTP_401_UNAUTHORIZED
 )
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from dotenv import load_dotenv
 
 # Carga de variables de entorno al inicio
 load_dotenv()
 
 # ---- Conexiones a la Base de Datos ----
-from model.usuario_connection import UsuarioConnection
+from config.database import get_pool, close_pool
+from config.passwords import PWD_HASHER, PasswordHasherOcupado
+from model.usuario_connection import UsuarioConnection, UsuarioDuplicado
 from model.tipo_usuario_connection import TipoUsuarioConnection
 from model.producto_connection import ProductoConnection
 from model.marca_connection import MarcaConnection
 from model.cliente_connection import ClienteConnection
 from model.venta_connection import VentaConnection
 from model.forecast_connection import ForecastConnection
+from model.abcxyz_connection import AbcxyzConnection, pack_payload, unpack_payload
+from model.job_connection import JobConnection
 
 # ---- Esquemas de Validación (Pydantic) ----
 from schema.usuario_schema import UsuarioSchema
@@ -41,52 +57,106 @@ from schema.producto_schema import ProductoSchema
 from schema.marca_schema import MarcaSchema
 from schema.cliente_schema import ClienteSchema
 from schema.venta_schema import VentaSchema
-from schema.auth_schema import LoginSchema
+from schema.auth_schema import LoginSchema, Principal
 from schema.abcxyz_schema import (
     ABCXYZConfigSchema,
     load_config,
     last_12_month_keys,
-    abc_label_from_cumshare,
-    xyz_label_from_cv,
-    month_key_from_date,
+    month_window_from_keys,
     save_config
 )
 from schema.ml_schema import (
     ForecastRequest,
+    ForecastHorizonRequest,
     ForecastResponseItem,
     ForecastRunInfo,
     ForecastHistoryDetail,
+    ForecastRunResumen,
+    ForecastCategoriaResumen,
 )
+from schema.job_schema import JobInfo
 
 # ---- Módulos de Machine Learning ----
-from ml.runtime_xgb import build_feature_row, predict_batch, baseline_from_maps
-from ml.lag1_postgres import lag1_from_postgres
+from ml.runtime_xgb import build_feature_columns, baseline_from_maps, XGB_DISPATCHER
+from ml.lag1_postgres import lag1_many_from_postgres
+from ml.date_utils import first_day_of_month, add_months
+from ml.abcxyz_engine import classify_abcxyz, matrix_from_monthly_totals
 
 # --- Inicialización del Estado ---
-# ⬇️ Guardamos el último análisis ABC-XYZ POR FUENTE (independientes entre sí)
-LAST_ABCXYZ_DB:    Optional[Dict[str, Any]] = None   # último análisis desde BD
-LAST_ABCXYZ_EXCEL: Optional[Dict[str, Any]] = None   # último análisis desde archivo
+# ⬇️ Los análisis ABC-XYZ se guardan POR FUENTE en la tabla abcxyz_resultado, así todos
+# los workers ven el mismo "último análisis". En memoria solo cacheamos payloads ya
+# leídos, por id_resultado (un resultado guardado no cambia nunca).
+ABCXYZ_CACHE_MAX = 8
+_abcxyz_cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+# Índices para los baselines del forecast por CSV, por id_resultado del análisis importado
+_csv_index_cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+def _lru_put(cache: "OrderedDict[int, Any]", key: int, value: Any) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > ABCXYZ_CACHE_MAX:
+        cache.popitem(last=False)
+
+def _cache_abcxyz(id_resultado: int, payload: Dict[str, Any]) -> None:
+    _lru_put(_abcxyz_cache, id_resultado, payload)
+
+async def _save_abcxyz(source: str, payload: Dict[str, Any], cache_key: Optional[str] = None) -> int:
+    blob = await run_in_threadpool(pack_payload, payload)
+    id_resultado = await abcxyz_conn.insert_resultado(source, payload["totals"]["items"], blob, cache_key)
+    _cache_abcxyz(id_resultado, payload)
+    return id_resultado
+
+async def _load_abcxyz(id_resultado: int) -> Optional[Dict[str, Any]]:
+    payload = _abcxyz_cache.get(id_resultado)
+    if payload is None:
+        blob = await abcxyz_conn.read_payload(id_resultado)
+        if blob is None:
+            return None
+        payload = await run_in_threadpool(unpack_payload, blob)
+    _cache_abcxyz(id_resultado, payload)
+    return payload
 
-def _get_last_abcxyz(source: Optional[str]) -> Optional[Dict[str, Any]]:
+async def _abcxyz_response(payload: Dict[str, Any]) -> Response:
+    """
+    Serializa un análisis ABC-XYZ fuera del event loop. El payload ya es JSON puro, así que
+    se evita jsonable_encoder (que en catálogos grandes bloquea el loop varios segundos).
+    """
+    body = await run_in_threadpool(
+        json.dumps, payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    )
+    return Response(content=body, media_type="application/json")
+
+async def _get_last_abcxyz(source: Optional[str]) -> Optional[Dict[str, Any]]:
     """
     Devuelve el último análisis según la fuente solicitada.
-    - 'db'    -> LAST_ABCXYZ_DB
-    - 'excel' -> LAST_ABCXYZ_EXCEL
-    - None    -> el más reciente de los dos (por compatibilidad)
+    - 'db'    -> último análisis desde BD
+    - 'excel' -> último análisis desde archivo
+    - None    -> el más reciente de los dos
     """
-    if source == "db":
-        return LAST_ABCXYZ_DB
-    if source == "excel":
-        return LAST_ABCXYZ_EXCEL
-    # sin fuente: devolvemos el que exista (prioriza el que tenga datos)
-    return LAST_ABCXYZ_DB or LAST_ABCXYZ_EXCEL
+    fuente = source if source in ("db", "excel") else None
+    id_resultado = await abcxyz_conn.read_ultimo_id(fuente)
+    if id_resultado is None:
+        return None
+    return await _load_abcxyz(id_resultado)
 
 # --- Configuración JWT y Seguridad ---
 SECRET_KEY = os.getenv("SECRET_KEY", "CAMBIA_ESTA_CLAVE_SUPER_SECRETA")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 120
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Contraseñas: bcrypt en un pool propio y acotado (config/passwords.py)
+async def _hash_contrasenia(contrasenia: str, guardada: Optional[str] = None) -> str:
+    """
+    Hashea una contraseña nueva. Solo en una edición, si viene exactamente el hash ya guardado
+    (el formulario reenvía lo que devolvió GET), se deja igual: nunca se acepta un hash
+    elegido por el cliente.
+    """
+    if guardada is not None and contrasenia == guardada and PWD_HASHER.es_hash(guardada):
+        return contrasenia
+    try:
+        return await PWD_HASHER.hash(contrasenia)
+    except PasswordHasherOcupado:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, intente nuevamente.")
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -98,32 +168,130 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 ROL_ADMIN = "administrador"
 ROL_USER  = "usuario"
 
-def _decode_roles_from_auth(authorization: str | None) -> list[str]:
-    """Lee el JWT del header Authorization y devuelve los roles en minúsculas."""
+# Caché de tokens ya verificados: el frontend manda el mismo JWT en cada request, así que
+# se guarda el principal por hash del token hasta su 'exp' (o JWT_CACHE_TTL, lo que llegue antes).
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", "2048"))
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", "300"))   # segundos
+_jwt_cache: "OrderedDict[bytes, tuple[float, Principal]]" = OrderedDict()
+
+def _principal_from_claims(claims: Dict[str, Any]) -> Principal:
+    roles = claims.get("roles") or []
+    if isinstance(roles, str):
+        roles = [roles]
+    sub = claims.get("sub")
+    return Principal(
+        id_usuario=int(sub) if sub is not None and str(sub).isdigit() else None,
+        usuario=claims.get("usuario"),
+        roles=[str(r).lower() for r in roles],
+    )
+
+def _principal_from_auth(authorization: str | None) -> Optional[Principal]:
+    """Lee el JWT del header Authorization; None si falta, es inválido o expiró."""
     if not authorization or not authorization.lower().startswith("bearer "):
-        return []
+        return None
     token = authorization.split(" ", 1)[1]
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    now = time.time()
+
+    hit = _jwt_cache.get(key)
+    if hit is not None:
+        expira, principal = hit
+        if now < expira:
+            _jwt_cache.move_to_end(key)
+            return principal
+        del _jwt_cache[key]   # venció el TTL o el propio token: se vuelve a verificar
+
     try:
         claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        roles = claims.get("roles") or []
-        if isinstance(roles, str):
-            roles = [roles]
-        return [str(r).lower() for r in roles]
     except JWTError:
-        return []
+        return None
+
+    principal = _principal_from_claims(claims)
+    expira = now + JWT_CACHE_TTL
+    if isinstance(claims.get("exp"), (int, float)):
+        expira = min(expira, float(claims["exp"]))
+    _jwt_cache[key] = (expira, principal)
+    while len(_jwt_cache) > JWT_CACHE_MAX:
+        _jwt_cache.popitem(last=False)
+    return principal
+
+async def get_principal(authorization: str | None = Header(None)) -> Principal:
+    """Dependency con el usuario autenticado. Ej: principal: Principal = Depends(get_principal)."""
+    principal = _principal_from_auth(authorization)
+    if principal is None:
+        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Token inválido o expirado")
+    return principal
 
 def require_roles(*allowed: str):
-    """Dependency para FastAPI. Ej: Depends(require_roles(ROL_ADMIN))."""
+    """
+    Dependency para FastAPI. Ej: Depends(require_roles(ROL_ADMIN)).
+    Devuelve el Principal, así el handler puede usarlo sin volver a leer el token.
+    """
     allowed = {a.lower() for a in allowed}
-    async def _dep(authorization: str | None = Header(None)):
-        roles = set(_decode_roles_from_auth(authorization))
-        if not roles & allowed:
+    async def _dep(authorization: str | None = Header(None)) -> Principal:
+        principal = _principal_from_auth(authorization)
+        if principal is None or not set(principal.roles) & allowed:
             raise HTTPException(status_code=403, detail="No autorizado")
-        return True
+        return principal
     return _dep
 
+# --- Pool de importaciones ABC-XYZ ---
+# Parseo de CSV/XLSX + clasificación en un pool propio y acotado: como mucho
+# ABCXYZ_IMPORT_WORKERS a la vez, el resto espera en cola sin bloquear el event loop.
+ABCXYZ_IMPORT_WORKERS = int(os.getenv("ABCXYZ_IMPORT_WORKERS", "2"))
+_import_executor: Optional[ThreadPoolExecutor] = None
+
+# --- Pool de importaciones de ventas ---
+# Parseo del archivo de /api/venta/importar en su propio pool: una carga masiva de ventas
+# no ocupa los hilos del ABC-XYZ (ni al revés).
+VENTA_IMPORT_WORKERS = int(os.getenv("VENTA_IMPORT_WORKERS", "2"))
+_venta_import_executor: Optional[ThreadPoolExecutor] = None
+
+# --- Trabajos en segundo plano ---
+# JOB_WORKERS tareas por proceso toman trabajos de la tabla job (ver sql/005_job.sql).
+# Mientras corre, el worker da un latido cada JOB_HEARTBEAT_SECONDS; un trabajo 'en_curso' sin
+# latidos en JOB_STALE_SECONDS se considera abandonado y se reintenta hasta JOB_MAX_INTENTOS veces.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))
+JOB_MAX_INTENTOS = int(os.getenv("JOB_MAX_INTENTOS", "3"))
+_job_wakeup: Optional[asyncio.Event] = None
+_job_parar: Optional[asyncio.Event] = None
+_job_tasks: List[asyncio.Task] = []
+
 # --- Configuración FastAPI y CORS ---
-app = FastAPI(title="Bee-Organized API Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abre el pool compartido al arrancar y lo cierra al apagar el worker
+    global _import_executor, _venta_import_executor, _job_wakeup, _job_parar
+    await get_pool()
+    _import_executor = ThreadPoolExecutor(
+        max_workers=ABCXYZ_IMPORT_WORKERS, thread_name_prefix="abcxyz-import"
+    )
+    _venta_import_executor = ThreadPoolExecutor(
+        max_workers=VENTA_IMPORT_WORKERS, thread_name_prefix="venta-import"
+    )
+    _job_wakeup = asyncio.Event()
+    _job_parar = asyncio.Event()
+    _job_tasks.extend(asyncio.create_task(_job_worker()) for _ in range(JOB_WORKERS))
+    yield
+    PWD_HASHER.shutdown()
+    # Los trabajos interrumpidos quedan 'en_curso' y otro worker los retoma al vencer JOB_STALE_SECONDS.
+    # Además de cancelar se avisa con _job_parar: psycopg puede absorber la cancelación si llega
+    # en medio de una consulta, y el worker igual debe salir del loop.
+    _job_parar.set()
+    _job_wakeup.set()
+    for task in _job_tasks:
+        task.cancel()
+    await asyncio.gather(*_job_tasks, return_exceptions=True)
+    _job_tasks.clear()
+    _import_executor.shutdown(wait=False, cancel_futures=True)
+    _venta_import_executor.shutdown(wait=False, cancel_futures=True)
+    await XGB_DISPATCHER.shutdown()
+    await close_pool()
+
+app = FastAPI(title="Bee-Organized API Backend", lifespan=lifespan)
 
 # Orígenes permitidos extraídos de tu configuración local/producción
 origins = [
@@ -136,10 +304,11 @@ app.add_middleware(
     allow_origins=origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
     allow_credentials=True if os.getenv("ALLOW_CREDENTIALS") == "true" else False,
 )
 
-# Instanciación global de conexiones de infraestructura base
+# Instanciación global de conexiones (cada operación toma una conexión del pool)
 conn = UsuarioConnection()
 tipo_conn = TipoUsuarioConnection()
 pconn = ProductoConnection()
@@ -147,6 +316,8 @@ marca_conn = MarcaConnection()
 cliente_conn = ClienteConnection()
 venta_conn = VentaConnection()
 forecast_conn = ForecastConnection()
+abcxyz_conn = AbcxyzConnection()
+job_conn = JobConnection()
 
 
 # ============================================================================
@@ -154,9 +325,9 @@ forecast_conn = ForecastConnection()
 # ============================================================================
 
 @app.get("/api/usuario/usuarios", status_code=HTTP_200_OK)
-def root():  
+async def root():  
     items = []
-    for data in conn.read_usuario():
+    for data in await conn.read_usuario():
         items.append({
             "id": data[0],
             "usuario": data[1],
@@ -167,51 +338,33 @@ def root():
         })
     return items
 
+# Mensajes de duplicado (los detectan los índices únicos de sql/008_usuario_unico.sql)
+_MSG_DUPLICADO = {
+    # ✅ HU0002-5: usuario duplicado
+    "usuario": "El nombre de usuario ya está registrado. Ingrese un usuario diferente.",
+    # ✅ HU0002-6: correo duplicado
+    "correo": "El correo electrónico ya está registrado. Ingrese un correo diferente.",
+}
+
 @app.post("/api/usuario/insert", status_code=HTTP_201_CREATED)
-def insert_usuario(user_data: UsuarioSchema):
+async def insert_usuario(user_data: UsuarioSchema):
     """
-    Crea el usuario, verifica duplicados y le asigna el rol 'usuario' por defecto.
+    Crea el usuario con el rol 'usuario' por defecto, en una sola transacción.
     """
     data = user_data.dict()
     data.pop("id", None)
-
-    # ✅ HU0002-5: validar usuario duplicado
-    if conn.get_by_usuario(data["usuario"]):
-        raise HTTPException(
-            status_code=HTTP_409_CONFLICT,
-            detail="El nombre de usuario ya está registrado. Ingrese un usuario diferente."
-        )
-
-    # ✅ HU0002-6: validar correo duplicado
-    if conn.get_by_correo(data["correo"]):
-        raise HTTPException(
-            status_code=HTTP_409_CONFLICT,
-            detail="El correo electrónico ya está registrado. Ingrese un correo diferente."
-        )
+    data["contrasenia"] = await _hash_contrasenia(data["contrasenia"])
 
     try:
-        data["contrasenia"] = pwd_context.hash(data["contrasenia"])
-    except Exception:
-        pass
-
-    conn.insert_usuario(data)
-
-    created = conn.get_by_usuario(data["usuario"])
-    if created:
-        nuevo_id = int(created[0])
-        try:
-            tipo_conn.insert_tipo_usuario({
-                "tipo_usuario": ROL_USER,
-                "id_usuario":  nuevo_id
-            })
-        except Exception as e:
-            print("WARN: no se pudo asignar rol por defecto:", e)
+        await conn.registrar_usuario(data, ROL_USER)
+    except UsuarioDuplicado as e:
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=_MSG_DUPLICADO[e.campo])
 
     return Response(status_code=HTTP_201_CREATED)
 
 @app.get("/api/usuario/{id}", status_code=HTTP_200_OK)
-def filtrar_usuario(id: str):
-    data = conn.filtrar_usuario(id)
+async def filtrar_usuario(id: str):
+    data = await conn.filtrar_usuario(id)
     if data:
         return {
             "id": data[0],
@@ -224,15 +377,20 @@ def filtrar_usuario(id: str):
     return {"message": "Usuario no encontrado"}
 
 @app.delete("/api/usuario/delete/{id}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def delete_usuario(id: str):
-    conn.delete_usuario(id)
+async def delete_usuario(id: str):
+    await conn.delete_usuario(id)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 @app.put("/api/usuario/update/{id}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def update_usuario(user_data: UsuarioSchema, id: str):
+async def update_usuario(user_data: UsuarioSchema, id: str):
     data = user_data.dict()
     data["id"] = id
-    conn.update_usuario(data)
+    actual = await conn.filtrar_usuario(id)
+    data["contrasenia"] = await _hash_contrasenia(data["contrasenia"], actual[5] if actual else None)
+    try:
+        await conn.update_usuario(data)
+    except UsuarioDuplicado as e:
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail=_MSG_DUPLICADO[e.campo])
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 
@@ -241,9 +399,9 @@ def update_usuario(user_data: UsuarioSchema, id: str):
 # ============================================================================
 
 @app.get("/api/tipo-usuario/listar", status_code=HTTP_200_OK)
-def listar_tipo_usuario():
+async def listar_tipo_usuario():
     items = []
-    for t in tipo_conn.read_tipo_usuario():
+    for t in await tipo_conn.read_tipo_usuario():
         items.append({
             "id_tipousuario": t[0],
             "tipo_usuario":   t[1],
@@ -252,8 +410,8 @@ def listar_tipo_usuario():
     return items
 
 @app.get("/api/tipo-usuario/{id_tipousuario}", status_code=HTTP_200_OK)
-def obtener_tipo_usuario(id_tipousuario: int):
-    t = tipo_conn.filtrar_tipo_usuario(id_tipousuario)
+async def obtener_tipo_usuario(id_tipousuario: int):
+    t = await tipo_conn.filtrar_tipo_usuario(id_tipousuario)
     if t:
         return {
             "id_tipousuario": t[0],
@@ -263,38 +421,37 @@ def obtener_tipo_usuario(id_tipousuario: int):
     return {"message": "Tipo de usuario no encontrado"}
 
 @app.get("/api/tipo-usuario/usuario/{id_usuario}", status_code=HTTP_200_OK)
-def listar_tipo_usuario_por_usuario(id_usuario: int):
-    rows = tipo_conn.listar_por_usuario(id_usuario)
+async def listar_tipo_usuario_por_usuario(id_usuario: int):
+    rows = await tipo_conn.listar_por_usuario(id_usuario)
     return [
         {"id_tipousuario": r[0], "tipo_usuario": r[1], "id_usuario": r[2]}
         for r in rows
     ]
 
 @app.post("/api/tipo-usuario/insert", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_201_CREATED)
-def insertar_tipo_usuario(payload: TipoUsuarioSchema):
+async def insertar_tipo_usuario(payload: TipoUsuarioSchema):
     data = payload.dict()
     data.pop("id_tipousuario", None)
-    tipo_conn.insert_tipo_usuario(data)
+    await tipo_conn.insert_tipo_usuario(data)
     return Response(status_code=HTTP_201_CREATED)
 
 @app.put("/api/tipo-usuario/update/{id_tipousuario}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def actualizar_tipo_usuario(payload: TipoUsuarioSchema, id_tipousuario: int):
+async def actualizar_tipo_usuario(payload: TipoUsuarioSchema, id_tipousuario: int):
     data = payload.dict()
     data["id_tipousuario"] = id_tipousuario
-    tipo_conn.update_tipo_usuario(data)
+    await tipo_conn.update_tipo_usuario(data)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 @app.delete("/api/tipo-usuario/delete/{id_tipousuario}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def eliminar_tipo_usuario(id_tipousuario: int):
-    tipo_conn.delete_tipo_usuario(id_tipousuario)
+async def eliminar_tipo_usuario(id_tipousuario: int):
+    await tipo_conn.delete_tipo_usuario(id_tipousuario)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
-def get_roles_for_user(user_id: int) -> list[str]:
-    rows = tipo_conn.listar_por_usuario(user_id)
+def _normalizar_roles(tipos) -> list[str]:
+    """Roles en minúsculas y sin vacíos; sin roles asignados se asume ROL_USER."""
     roles = []
-    for r in rows:
-        rol = (r[1] if isinstance(r, (list, tuple)) else r.get("tipo_usuario")) or ""
-        rol = str(rol).strip().lower()
+    for rol in tipos:
+        rol = str(rol or "").strip().lower()
         if rol:
             roles.append(rol)
     return roles or [ROL_USER]
@@ -305,9 +462,9 @@ def get_roles_for_user(user_id: int) -> list[str]:
 # ============================================================================
 
 @app.get("/api/producto/listar", status_code=HTTP_200_OK)
-def listar_productos():
+async def listar_productos():
     items = []
-    for row in pconn.read_producto():
+    for row in await pconn.read_producto():
         items.append({
             "id_producto":     row[0],
             "nombre_producto": row[1],
@@ -318,9 +475,9 @@ def listar_productos():
     return items
 
 @app.get("/api/producto/listar-view", status_code=HTTP_200_OK)
-def listar_productos_con_marca():
+async def listar_productos_con_marca():
     items = []
-    for row in pconn.read_producto_view():
+    for row in await pconn.read_producto_view():
         items.append({
             "id_producto":     row[0],
             "nombre_producto": row[1],
@@ -332,8 +489,8 @@ def listar_productos_con_marca():
     return items
 
 @app.get("/api/producto/{id}", status_code=HTTP_200_OK)
-def obtener_producto(id: int):
-    row = pconn.filtrar_producto(id)
+async def obtener_producto(id: int):
+    row = await pconn.filtrar_producto(id)
     if not row:
         return {"message": "Producto no encontrado"}
     return {
@@ -345,22 +502,22 @@ def obtener_producto(id: int):
     }
 
 @app.post("/api/producto/insert", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_201_CREATED)
-def crear_producto(prod_data: ProductoSchema):
+async def crear_producto(prod_data: ProductoSchema):
     data = prod_data.dict()
     data.pop("id_producto", None)
-    pconn.insert_producto(data)
+    await pconn.insert_producto(data)
     return Response(status_code=HTTP_201_CREATED)
 
 @app.put("/api/producto/update/{id}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def actualizar_producto(prod_data: ProductoSchema, id: int):
+async def actualizar_producto(prod_data: ProductoSchema, id: int):
     data = prod_data.dict()
     data["id_producto"] = id
-    pconn.update_producto(data)
+    await pconn.update_producto(data)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 @app.delete("/api/producto/delete/{id}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def eliminar_producto(id: int):
-    pconn.delete_producto(id)
+async def eliminar_producto(id: int):
+    await pconn.delete_producto(id)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 
@@ -369,9 +526,9 @@ def eliminar_producto(id: int):
 # ============================================================================
 
 @app.get("/api/marca/listar", status_code=HTTP_200_OK)
-def listar_marcas():
+async def listar_marcas():
     items = []
-    for row in marca_conn.read_marca():
+    for row in await marca_conn.read_marca():
         items.append({
             "id_marca": row[0],
             "nombre_marca": row[1],
@@ -379,30 +536,30 @@ def listar_marcas():
     return items
 
 @app.get("/api/marca/{id_marca}", status_code=HTTP_200_OK)
-def obtener_marca(id_marca: int):
-    row = marca_conn.filtrar_marca(id_marca)
+async def obtener_marca(id_marca: int):
+    row = await marca_conn.filtrar_marca(id_marca)
     if row:
         return {"id_marca": row[0], "nombre_marca": row[1]}
     return {"message": "Marca no encontrada"}
 
 @app.post("/api/marca/insert", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_201_CREATED)
-def insertar_marca(data: MarcaSchema):
+async def insertar_marca(data: MarcaSchema):
     payload = data.dict()
     payload.pop("id_marca", None)
-    marca_conn.insert_marca(payload)
+    await marca_conn.insert_marca(payload)
     return Response(status_code=HTTP_201_CREATED)
 
 @app.put("/api/marca/update/{id_marca}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def actualizar_marca(data: MarcaSchema, id_marca: int):
+async def actualizar_marca(data: MarcaSchema, id_marca: int):
     payload = data.dict()
     payload["id_marca"] = id_marca
-    marca_conn.update_marca(payload)
+    await marca_conn.update_marca(payload)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 @app.delete("/api/marca/delete/{id_marca}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def eliminar_marca(id_marca: int):
+async def eliminar_marca(id_marca: int):
     try:
-        marca_conn.delete_marca(id_marca)
+        await marca_conn.delete_marca(id_marca)
     except Exception as e:
         raise HTTPException(
             status_code=HTTP_409_CONFLICT,
@@ -416,9 +573,9 @@ def eliminar_marca(id_marca: int):
 # ============================================================================
 
 @app.get("/api/cliente/listar", status_code=HTTP_200_OK)
-def listar_clientes():
+async def listar_clientes():
     items = []
-    for row in cliente_conn.read_cliente():
+    for row in await cliente_conn.read_cliente():
         items.append({
             "id_cliente": row[0],
             "nombre_empresa": row[1],
@@ -428,23 +585,23 @@ def listar_clientes():
     return items
 
 @app.post("/api/cliente/insert", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_201_CREATED)
-def insert_cliente(payload: ClienteSchema):
+async def insert_cliente(payload: ClienteSchema):
     data = payload.dict()
     data.pop("id_cliente", None)
 
     # ✅ HU0020-4: validar RUC único
-    if cliente_conn.get_by_ruc(data["ruc"]):
+    if await cliente_conn.get_by_ruc(data["ruc"]):
         raise HTTPException(
             status_code=HTTP_409_CONFLICT,
             detail="El RUC ya existe en la aplicación."
         )
 
-    cliente_conn.insert_cliente(data)
+    await cliente_conn.insert_cliente(data)
     return Response(status_code=HTTP_201_CREATED)
 
 @app.get("/api/cliente/{id_cliente}", status_code=HTTP_200_OK)
-def obtener_cliente(id_cliente: int):
-    row = cliente_conn.filtrar_cliente(id_cliente)
+async def obtener_cliente(id_cliente: int):
+    row = await cliente_conn.filtrar_cliente(id_cliente)
     if not row:
         return {"message": "Cliente no encontrado"}
     return {
@@ -455,24 +612,24 @@ def obtener_cliente(id_cliente: int):
     }
 
 @app.delete("/api/cliente/delete/{id_cliente}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def delete_cliente(id_cliente: int):
-    cliente_conn.delete_cliente(id_cliente)
+async def delete_cliente(id_cliente: int):
+    await cliente_conn.delete_cliente(id_cliente)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 @app.put("/api/cliente/update/{id_cliente}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def update_cliente(payload: ClienteSchema, id_cliente: int):
+async def update_cliente(payload: ClienteSchema, id_cliente: int):
     data = payload.dict()
     data["id_cliente"] = id_cliente
 
     # ✅ HU0022-4: validar RUC único (excluyendo el propio registro)
-    existing = cliente_conn.get_by_ruc(data["ruc"])
+    existing = await cliente_conn.get_by_ruc(data["ruc"])
     if existing and int(existing[0]) != id_cliente:
         raise HTTPException(
             status_code=HTTP_409_CONFLICT,
             detail="El RUC ya existe en la aplicación."
         )
 
-    cliente_conn.update_cliente(data)
+    await cliente_conn.update_cliente(data)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 
@@ -480,10 +637,75 @@ def update_cliente(payload: ClienteSchema, id_cliente: int):
 # --------- ENDPOINTS: VENTA ---------
 # ============================================================================
 
+VENTA_PAGE_SIZE = 100   # filas por página si el cliente no indica 'limit'
+VENTA_PAGE_MAX  = 500   # tope de filas por página
+
+def _venta_filtros(
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    id_producto: Optional[int] = None,
+    id_cliente: Optional[int] = None,
+    estado: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Dependency con los filtros comunes de los listados de ventas."""
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "id_producto": id_producto,
+        "id_cliente": id_cliente,
+        "estado": estado,
+    }
+
+def _encode_venta_cursor(fecha: Optional[date], id_fila: int) -> str:
+    # fecha vacía = venta sin fecha (van al final del listado)
+    raw = f"{fecha.isoformat() if fecha else ''}|{id_fila}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_venta_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        fecha_txt, id_txt = raw.split("|")
+        return (date.fromisoformat(fecha_txt) if fecha_txt else None), int(id_txt)
+    except Exception:
+        raise HTTPException(400, detail="Cursor de paginación inválido.")
+
+async def _venta_page(read_page, response: Response, limit: int, cursor: Optional[str], filtros: Dict[str, Any], fecha_idx: int):
+    """
+    Lee una página (keyset sobre fecha DESC, id_venta DESC).
+    Si quedan más filas, deja el cursor de la siguiente página en el header X-Next-Cursor.
+    """
+    limit = max(1, min(limit, VENTA_PAGE_MAX))
+    rows = await read_page(limit + 1, _decode_venta_cursor(cursor), **filtros)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = _encode_venta_cursor(last[fecha_idx], last[0])
+    return rows
+
+def _venta_view_item(r) -> Dict[str, Any]:
+    return {
+        "id_venta": r[0],
+        "id_producto": r[1],
+        "producto_nombre": r[2],
+        "id_cliente": r[3],
+        "cliente_nombre": r[4],
+        "fecha": r[5].isoformat() if r[5] else None,
+        "cantidad": r[6],
+        "importe_total": float(r[7]) if r[7] is not None else 0.0,
+        "estado": r[8],
+    }
+
 @app.get("/api/venta/listar", status_code=HTTP_200_OK)
-def listar_ventas():
+async def listar_ventas(
+    response: Response,
+    limit: int = VENTA_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    filtros: Dict[str, Any] = Depends(_venta_filtros),
+):
     items = []
-    for r in venta_conn.read_venta():
+    for r in await _venta_page(venta_conn.read_venta_page, response, limit, cursor, filtros, fecha_idx=3):
         items.append({
             "id_venta": r[0],
             "id_producto": r[1],
@@ -495,9 +717,146 @@ def listar_ventas():
         })
     return items
 
+# Dashboard: se declara antes de /api/venta/{id_venta} para que esa ruta no la capture
+@app.get("/api/venta/listar-view", status_code=HTTP_200_OK)
+async def listar_ventas_view(
+    response: Response,
+    limit: int = VENTA_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    filtros: Dict[str, Any] = Depends(_venta_filtros),
+):
+    rows = await _venta_page(venta_conn.read_venta_view_page, response, limit, cursor, filtros, fecha_idx=5)
+    return [_venta_view_item(r) for r in rows]
+
+VENTA_EXPORT_BATCH = 2000   # filas por lote al exportar
+VENTA_EXPORT_COLUMNS = [
+    "id_venta", "id_producto", "producto_nombre", "id_cliente", "cliente_nombre",
+    "fecha", "cantidad", "importe_total", "estado",
+]
+
+@app.get("/api/venta/exportar", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
+async def exportar_ventas(formato: str = "csv", filtros: Dict[str, Any] = Depends(_venta_filtros)):
+    """
+    Exporta el historial de ventas (con los mismos filtros que el listado) como CSV o NDJSON.
+    Las filas se leen por lotes con un cursor del servidor y se envían a medida que llegan,
+    así la memoria no crece con el tamaño de la tabla.
+    """
+    formato = formato.lower()
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(400, detail="Formato inválido: use 'csv' o 'ndjson'.")
+
+    async def generar():
+        if formato == "csv":
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            w.writerow(VENTA_EXPORT_COLUMNS)
+            yield buf.getvalue()
+        async for rows in venta_conn.stream_venta_view(VENTA_EXPORT_BATCH, **filtros):
+            buf = io.StringIO()
+            if formato == "csv":
+                w = csv.writer(buf)
+                for r in rows:
+                    item = _venta_view_item(r)
+                    w.writerow([item[c] for c in VENTA_EXPORT_COLUMNS])
+            else:
+                for r in rows:
+                    buf.write(json.dumps(_venta_view_item(r), ensure_ascii=False))
+                    buf.write("\n")
+            yield buf.getvalue()
+
+    media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f"attachment; filename=ventas.{formato}"}
+    return StreamingResponse(generar(), media_type=media_type, headers=headers)
+
+VENTA_IMPORT_MAX_ERRORES = 1000   # errores detallados en la respuesta (el total se informa siempre)
+_INT4_MIN, _INT4_MAX = -2**31, 2**31 - 1   # rango de las columnas integer (staging y venta)
+
+def _venta_import_row(linea: int, obj: Any) -> tuple:
+    """Valida una fila del archivo con las mismas reglas que /api/venta/insert (VentaSchema)."""
+    if not isinstance(obj, dict):
+        raise ValueError("Se esperaba un objeto JSON")
+    data = {k: (None if isinstance(v, str) and not v.strip() else v) for k, v in obj.items()}
+    data.pop("id_venta", None)
+    try:
+        v = VentaSchema.model_validate(data)
+    except ValidationError as e:
+        err = e.errors()[0]
+        campo = ".".join(str(x) for x in err.get("loc", ())) or "fila"
+        raise ValueError(f"{campo}: {err.get('msg')}")
+    # VentaSchema acepta enteros de cualquier tamaño: uno fuera de rango haría fallar
+    # el COPY (y con él todo el archivo) en vez de quedar como error de esta fila
+    for campo in ("id_producto", "id_cliente", "cantidad", "estado"):
+        valor = getattr(v, campo)
+        if valor is not None and not _INT4_MIN <= valor <= _INT4_MAX:
+            raise ValueError(f"{campo}: fuera de rango")
+    return (linea, v.id_producto, v.id_cliente, v.fecha, v.cantidad, v.estado)
+
+def _ventas_from_upload(fileobj, formato: str):
+    """
+    Parsea el archivo de ventas (CSV con encabezado o NDJSON) en filas para el COPY de staging.
+    Devuelve (rows, errores) con errores = [(linea, motivo), ...]. Se ejecuta en el pool de importaciones.
+    """
+    rows: List[tuple] = []
+    errores: List[tuple] = []
+    fileobj.seek(0)
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        if formato == "csv":
+            reader = csv.DictReader(text)
+            if not reader.fieldnames or not {"id_producto", "id_cliente", "cantidad"} <= set(reader.fieldnames):
+                raise HTTPException(400, detail="Encabezados requeridos: id_producto, id_cliente, cantidad (opcionales: fecha, estado).")
+            for obj in reader:
+                try:
+                    rows.append(_venta_import_row(reader.line_num, obj))
+                except ValueError as e:
+                    errores.append((reader.line_num, str(e)))
+        else:
+            for linea, raw in enumerate(text, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    rows.append(_venta_import_row(linea, json.loads(raw)))
+                except ValueError as e:   # incluye JSONDecodeError
+                    errores.append((linea, str(e)))
+    finally:
+        text.detach()   # no cerrar el archivo del UploadFile al soltar el wrapper
+    return rows, errores
+
+@app.post("/api/venta/importar", dependencies=[Depends(require_roles(ROL_ADMIN))])
+async def importar_ventas(file: UploadFile = File(...), formato: Optional[str] = None, parcial: bool = False):
+    """
+    Carga masiva de ventas desde CSV o NDJSON (mismas columnas que /api/venta/insert).
+    Todo va en una transacción: COPY a staging + un INSERT ... SELECT que calcula el importe.
+    - parcial=false (default): si alguna fila es inválida no se inserta nada (422 con el reporte).
+    - parcial=true: se insertan las filas válidas y se reportan las rechazadas.
+    """
+    name = (file.filename or "").lower()
+    formato = (formato or ("csv" if name.endswith(".csv") else "ndjson" if name.endswith((".ndjson", ".jsonl")) else "")).lower()
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(400, detail="Formato inválido: use 'csv' o 'ndjson'.")
+
+    loop = asyncio.get_running_loop()
+    rows, errores = await loop.run_in_executor(_venta_import_executor, _ventas_from_upload, file.file, formato)
+
+    # Con errores de formato y sin 'parcial' solo se valida el resto (para un reporte completo)
+    insertadas, errores_bd = await venta_conn.importar_ventas(
+        rows, parcial=parcial, solo_validar=bool(errores) and not parcial
+    )
+    errores = sorted(errores + list(errores_bd))
+
+    ok = not errores
+    body = {
+        "ok": ok,
+        "insertadas": insertadas,
+        "rechazadas": len(errores),
+        "errores": [{"linea": l, "error": m} for l, m in errores[:VENTA_IMPORT_MAX_ERRORES]],
+    }
+    status = HTTP_201_CREATED if ok or parcial else 422
+    return JSONResponse(content=body, status_code=status)
+
 @app.get("/api/venta/{id_venta}", status_code=HTTP_200_OK)
-def obtener_venta(id_venta: int):
-    r = venta_conn.filtrar_venta(id_venta)
+async def obtener_venta(id_venta: int):
+    r = await venta_conn.filtrar_venta(id_venta)
     if r:
         return {
             "id_venta": r[0],
@@ -511,22 +870,22 @@ def obtener_venta(id_venta: int):
     return {"message": "Venta no encontrada"}
 
 @app.post("/api/venta/insert", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_201_CREATED)
-def insert_venta(v: VentaSchema):
+async def insert_venta(v: VentaSchema):
     data = v.model_dump()
     data.pop("id_venta", None)
-    venta_conn.insert_venta(data)
+    await venta_conn.insert_venta(data)
     return Response(status_code=HTTP_201_CREATED)
 
 @app.put("/api/venta/update/{id_venta}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def update_venta(v: VentaSchema, id_venta: int):
+async def update_venta(v: VentaSchema, id_venta: int):
     data = v.model_dump()
     data["id_venta"] = id_venta
-    venta_conn.update_venta(data)
+    await venta_conn.update_venta(data)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 @app.delete("/api/venta/delete/{id_venta}", dependencies=[Depends(require_roles(ROL_ADMIN))], status_code=HTTP_204_NO_CONTENT)
-def delete_venta(id_venta: int):
-    venta_conn.delete_venta(id_venta)
+async def delete_venta(id_venta: int):
+    await venta_conn.delete_venta(id_venta)
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 
@@ -535,32 +894,46 @@ def delete_venta(id_venta: int):
 # ============================================================================
 
 @app.post("/api/auth/login")
-def login(payload: LoginSchema):
-    row = conn.get_by_usuario(payload.usuario)
+async def login(payload: LoginSchema):
+    # Usuario y roles en una sola consulta
+    row = await conn.get_login(payload.usuario)
     if not row:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="El usuario ingresado no existe"
         )
 
-    stored_pwd = row[5]
+    stored_pwd = row[5] or ""
     provided = payload.contrasenia
+    user_id = int(row[0])
 
-    ok = False
     try:
-        ok = pwd_context.verify(provided, stored_pwd)
-    except Exception:
-        ok = False
-    if not ok:
-        ok = provided == stored_pwd
+        if PWD_HASHER.es_hash(stored_pwd):
+            ok = await PWD_HASHER.verify(provided, stored_pwd)
+            # Cambió el costo (BCRYPT_ROUNDS) o el esquema: se re-hashea con la clave recién verificada
+            migrar = ok and PWD_HASHER.necesita_rehash(stored_pwd)
+        else:
+            # Cuenta legada con la clave en texto plano: se compara y se migra a hash en este login.
+            # (Solo aplica a valores que NO son un hash; ya no se acepta "la contraseña igual al hash".)
+            ok = bool(stored_pwd) and hmac.compare_digest(provided.encode("utf-8"), stored_pwd.encode("utf-8"))
+            migrar = ok
+    except PasswordHasherOcupado:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, intente nuevamente.")
+
     if not ok:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="La contraseña es incorrecta"
         )
 
-    user_id = int(row[0])
-    roles = get_roles_for_user(user_id)
+    if migrar:
+        # Si falla (cola llena, BD), el login sigue: se reintenta en el próximo
+        try:
+            await conn.update_contrasenia(user_id, await PWD_HASHER.hash(provided), stored_pwd)
+        except Exception as e:
+            print("WARN: no se pudo actualizar el hash de la contraseña:", e)
+
+    roles = _normalizar_roles(row[6])
 
     token = create_access_token({"sub": str(user_id), "usuario": row[1], "roles": roles})
 
@@ -576,27 +949,10 @@ def login(payload: LoginSchema):
         }
     }
 
-
-# ============================================================================
-# --------- ENDPOINTS: DASHBOARD ---------
-# ============================================================================
-
-@app.get("/api/venta/listar-view", status_code=HTTP_200_OK)
-def listar_ventas_view():
-    items = []
-    for r in venta_conn.read_venta_view():
-        items.append({
-            "id_venta": r[0],
-            "id_producto": r[1],
-            "producto_nombre": r[2],
-            "id_cliente": r[3],
-            "cliente_nombre": r[4],
-            "fecha": r[5].isoformat() if r[5] else None,
-            "cantidad": r[6],
-            "importe_total": float(r[7]) if r[7] is not None else 0.0,
-            "estado": r[8],
-        })
-    return items
+@app.get("/api/auth/metrics", dependencies=[Depends(require_roles(ROL_ADMIN))])
+def auth_metrics():
+    """Métricas del pool de bcrypt (por worker): operaciones, cola, rechazos y tiempos."""
+    return PWD_HASHER.metrics()
 
 
 # ============================================================================
@@ -617,121 +973,74 @@ def update_abcxyz_config(cfg: ABCXYZConfigSchema):
     return cfg
 
 @app.get("/api/abcxyz/precheck")
-def abcxyz_precheck():
+async def abcxyz_precheck():
     cfg = load_config()
-    prods = list(ProductoConnection().read_producto())
-    ventas = list(VentaConnection().read_venta())
+    desde, hasta = month_window_from_keys(last_12_month_keys())
+    hay_productos, hay_ventas, hay_ventas_ventana = await venta_conn.read_precheck(desde, hasta)
 
     reasons = []
-    if len(prods) == 0:
+    if not hay_productos:
         reasons.append("No hay productos.")
-    if len(ventas) == 0:
+    if not hay_ventas:
         reasons.append("No hay ventas registradas.")
-        
-    keys = set(last_12_month_keys())
-    hay = False
-    for v in ventas:
-        f = v[3]
-        if f and month_key_from_date(f) in keys:
-            hay = True
-            break
-    if not hay:
+    if not hay_ventas_ventana:
         reasons.append("No hay ventas en los últimos 12 meses.")
 
     return {"ok": len(reasons) == 0, "reasons": reasons, "config": cfg.dict()}
 
-@app.post("/api/abcxyz/run", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
-def abcxyz_run_from_db():
-    global LAST_ABCXYZ_DB
+def _abcxyz_cache_key(cfg: ABCXYZConfigSchema, desde: date, hasta: date, version: int) -> str:
+    """
+    Clave de caché de /api/abcxyz/run: hash de la configuración + ventana de meses + versión de datos.
+    """
+    cfg_hash = hashlib.sha256(json.dumps(cfg.dict(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"cfg:{cfg_hash}|{desde.isoformat()}..{hasta.isoformat()}|v{version}"
+
+def _abcxyz_from_db_rows(keys: List[str], prows, mrows, cfg: ABCXYZConfigSchema) -> Dict[str, Any]:
+    """
+    Clasifica ABC-XYZ a partir de los productos y de los totales mensuales
+    (id_producto, mes, cantidad, importe) ya agregados en la BD para la ventana 'keys'.
+    """
+    ids = [r[0] for r in prows]
+    names = [r[1] for r in prows]
+    qty, amt = matrix_from_monthly_totals(ids, keys, mrows)
+    return classify_abcxyz(months=keys, ids=ids, names=names, qty=qty, amt=amt, cfg=cfg, source="db")
 
+async def _abcxyz_run_db() -> tuple[int, Dict[str, Any]]:
+    """
+    Análisis ABC-XYZ desde la BD (o el resultado guardado si nada cambió).
+    Devuelve (id_resultado, payload). Lo usan /api/abcxyz/run y los trabajos en segundo plano.
+    """
     cfg = load_config()
     keys = last_12_month_keys()
-    kset = set(keys)
+    desde, hasta = month_window_from_keys(keys)
 
-    prows = pconn.read_producto()
-    prod_map = {r[0]: {"id": r[0], "name": r[1]} for r in prows}
-    vrows = venta_conn.read_venta()
+    # La versión se lee ANTES que los datos: si una venta entra en medio, el resultado queda
+    # guardado con la versión anterior y la próxima corrida simplemente no lo reutiliza.
+    version = await abcxyz_conn.read_data_version()
+    cache_key = _abcxyz_cache_key(cfg, desde, hasta, version)
 
-    monthly_qty = defaultdict(lambda: defaultdict(float))
-    monthly_amt = defaultdict(lambda: defaultdict(float))
+    # Nada cambió desde una corrida anterior: se devuelve el resultado guardado
+    id_resultado = await abcxyz_conn.touch_by_cache_key("db", cache_key)
+    if id_resultado is not None:
+        payload = await _load_abcxyz(id_resultado)
+        if payload is not None:
+            return id_resultado, payload
 
-    for r in vrows:
-        pid = r[1]
-        f = r[3]
-        if not f or pid not in prod_map:
-            continue
-        mk = month_key_from_date(f)
-        if mk not in kset:
-            continue
-        monthly_qty[pid][mk] += float(r[4] or 0.0)
-        monthly_amt[pid][mk] += float(r[5] or 0.0)
-
-    rows = []
-    total_revenue = 0.0
-    for pid, meta in prod_map.items():
-        qty_series = [monthly_qty[pid].get(k, 0.0) for k in keys]
-        amt_series = [monthly_amt[pid].get(k, 0.0) for k in keys]
-        tot_qty = sum(qty_series)
-        tot_amt = sum(amt_series)
-        total_revenue += tot_amt
-
-        mean = (tot_qty / 12.0)
-        sd = pstdev(qty_series) if any(qty_series) else 0.0
-        cv = (sd / mean) if mean > 0 else 999.0
-
-        rows.append({
-            "id_producto": pid,
-            "producto": meta["name"],
-            "qty_series": qty_series,
-            "amt_series": amt_series,
-            "total_qty": tot_qty,
-            "total_revenue": tot_amt,
-            "cv": cv,
-        })
+    prows = await pconn.read_producto()
+    # Solo los totales por producto y mes de la ventana (agregados en SQL)
+    mrows = await venta_conn.read_monthly_totals(desde, hasta)
 
-    use_qty_for_abc = (total_revenue == 0.0)
-    rows.sort(key=lambda r: r["total_qty"] if use_qty_for_abc else r["total_revenue"], reverse=True)
-
-    cum = 0.0
-    base_total = sum(r["total_qty"] for r in rows) if use_qty_for_abc else total_revenue
-
-    res = []
-    for r in rows:
-        cum += (r["total_qty"] if use_qty_for_abc else r["total_revenue"])
-        share = (cum / base_total) if base_total > 0 else 0.0
-        abcl = abc_label_from_cumshare(share, cfg.a_cut, cfg.b_cut)
-        xyzl = xyz_label_from_cv(r["cv"], cfg.x_cut, cfg.y_cut)
-        res.append({
-            **r,
-            "ABC": abcl,
-            "XYZ": xyzl,
-            "ABCXYZ": abcl + xyzl
-        })
-
-    grid = {a: {x: 0 for x in ["X","Y","Z"]} for a in ["A","B","C"]}
-    for r in res:
-        grid[r["ABC"]][r["XYZ"]] += 1
-    count = len(res)
-    perc = {
-        a: {x: (grid[a][x] / count * 100 if count else 0) for x in ["X","Y","Z"]}
-        for a in ["A","B","C"]
-    }
-
-    top = sorted(res, key=lambda r: r["total_qty"], reverse=True)[:3]
-    top_series = [{"name": r["producto"], "qty": r["qty_series"]} for r in top]
-
-    payload = {
-        "months": keys,
-        "rows": res,
-        "matrix": {"grid": grid, "percent": perc},
-        "totals": {"revenue": total_revenue, "items": count},
-        "top_series": top_series,
-        "source": "db",
-    }
+    # La clasificación es CPU pura: se ejecuta fuera del event loop
+    payload = await run_in_threadpool(_abcxyz_from_db_rows, keys, prows, mrows, cfg)
 
     # Guardar como "último análisis desde BD"
-    LAST_ABCXYZ_DB = payload
-    return payload
+    id_resultado = await _save_abcxyz("db", payload, cache_key)
+    return id_resultado, payload
+
+@app.post("/api/abcxyz/run", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
+async def abcxyz_run_from_db():
+    _, payload = await _abcxyz_run_db()
+    return await _abcxyz_response(payload)
 
 @app.get("/api/abcxyz/template")
 def abcxyz_template():
@@ -744,67 +1053,80 @@ def abcxyz_template():
     headers = {"Content-Disposition": "attachment; filename=plantilla_abcxyz.csv"}
     return Response(content=output.getvalue(), media_type="text/csv", headers=headers)
 
-@app.post("/api/abcxyz/import", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
-async def abcxyz_import(file: UploadFile = File(...)):
-    global LAST_ABCXYZ_EXCEL
-    content = await file.read()
-    name = (file.filename or "").lower()
-
-    def detect_month_keys_from_header(header_list):
-        months = []
-        for h in header_list or []:
-            if h is None:
-                continue
-            s = str(h).strip()
-            if re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", s):
-                months.append(s)
-        months = sorted(set(months))
-        return months[-12:] if len(months) > 12 else months
-
-    series = []
+def _detect_month_keys_from_header(header_list):
+    months = []
+    for h in header_list or []:
+        if h is None:
+            continue
+        s = str(h).strip()
+        if re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", s):
+            months.append(s)
+    months = sorted(set(months))
+    return months[-12:] if len(months) > 12 else months
+
+def _check_month_keys(keys, header):
+    if not keys:
+        keys = last_12_month_keys()
+        missing = [k for k in keys if k not in header]
+        if missing:
+            raise HTTPException(400, detail=f"No se detectaron columnas YYYY-MM. Faltan: {', '.join(missing)}")
+
+    if len(keys) != 12:
+        raise HTTPException(400, detail=f"Se requieren 12 meses. Detectados: {len(keys)}")
+    return keys
+
+def _abcxyz_from_upload(fileobj, name: str, cfg: ABCXYZConfigSchema) -> Dict[str, Any]:
+    """
+    Parsea el archivo subido (CSV o XLSX) y clasifica ABC-XYZ.
+    Es trabajo síncrono y pesado: se ejecuta en el pool de importaciones, nunca en el event loop.
+    """
+    # Acumuladores por columna: las cantidades van directo a un buffer de doubles (12 por fila)
+    ids: List[Optional[int]] = []
+    names: List[str] = []
+    marcas: List[str] = []
+    qty_buf = array("d")
     keys = []
 
+    # Se lee el archivo subido (ya en disco/spool) sin copiarlo entero a memoria
+    fileobj.seek(0)
+
     if name.endswith(".csv"):
-        text = content.decode("utf-8", errors="ignore")
-        reader = csv.DictReader(io.StringIO(text))
-        header = reader.fieldnames or []
-        keys = detect_month_keys_from_header(header)
-        if not keys:
-            keys = last_12_month_keys()
-            missing = [k for k in keys if k not in header]
-            if missing:
-                raise HTTPException(400, detail=f"No se detectaron columnas YYYY-MM. Faltan: {', '.join(missing)}")
-
-        if len(keys) != 12:
-            raise HTTPException(400, detail=f"Se requieren 12 meses. Detectados: {len(keys)}")
-
-        for row in reader:
-            series.append({
-                "id_producto": int(row.get("id_producto", 0)) if row.get("id_producto") else None,
-                "producto": (row.get("producto") or "").strip(),
-                "marca": (row.get("marca") or "").strip(),
-                "qty_series": [float((row.get(k) or 0)) for k in keys],
-            })
+        text = io.TextIOWrapper(fileobj, encoding="utf-8", errors="ignore", newline="")
+        try:
+            reader = csv.reader(text)
+            header = next(reader, None) or []
+            keys = _check_month_keys(_detect_month_keys_from_header(header), header)
+
+            # misma resolución de columnas que DictReader (si hay duplicados, gana la última)
+            col = {h: i for i, h in enumerate(header)}
+            idx_pid, idx_prod, idx_marca = col.get("id_producto"), col.get("producto"), col.get("marca")
+            idx_cols = [col.get(k) for k in keys]
+
+            def cell(row, i):
+                return row[i] if i is not None and i < len(row) else None
+
+            for row in reader:
+                if not row:
+                    continue
+                pid = cell(row, idx_pid)
+                ids.append(int(pid) if pid else None)
+                names.append((cell(row, idx_prod) or "").strip())
+                marcas.append((cell(row, idx_marca) or "").strip())
+                qty_buf.extend(float(cell(row, i) or 0) for i in idx_cols)
+        finally:
+            text.detach()   # no cerrar el archivo del UploadFile al soltar el wrapper
     else:
         try:
             import openpyxl  # type: ignore
         except ImportError:
             raise HTTPException(400, detail="Para XLSX instala openpyxl o sube CSV.")
 
-        wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
         ws = wb.active
         header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True))
         header = [str(c).strip() if c is not None else "" for c in header_row]
 
-        keys = detect_month_keys_from_header(header)
-        if not keys:
-            keys = last_12_month_keys()
-            missing = [k for k in keys if k not in header]
-            if missing:
-                raise HTTPException(400, detail=f"No se detectaron columnas YYYY-MM. Faltan: {', '.join(missing)}")
-
-        if len(keys) != 12:
-            raise HTTPException(400, detail=f"Se requieren 12 meses. Detectados: {len(keys)}")
+        keys = _check_month_keys(_detect_month_keys_from_header(header), header)
 
         try:
             idx_pid = header.index("id_producto")
@@ -816,75 +1138,51 @@ async def abcxyz_import(file: UploadFile = File(...)):
         idx_cols = [header.index(k) for k in keys]
 
         for r in ws.iter_rows(min_row=2, values_only=True):
-            series.append({
-                "id_producto": int(r[idx_pid]) if r[idx_pid] not in (None, "") else None,
-                "producto": str(r[idx_prod]) if r[idx_prod] is not None else "",
-                "marca": str(r[idx_marca]).strip() if idx_marca is not None and r[idx_marca] is not None else "",
-                "qty_series": [float(r[i] or 0) for i in idx_cols],
-            })
+            ids.append(int(r[idx_pid]) if r[idx_pid] not in (None, "") else None)
+            names.append(str(r[idx_prod]) if r[idx_prod] is not None else "")
+            marcas.append(str(r[idx_marca]).strip() if idx_marca is not None and r[idx_marca] is not None else "")
+            qty_buf.extend(float(r[i] or 0) for i in idx_cols)
+        wb.close()
+
+    # En archivo no hay importes: el ABC se calcula sobre la cantidad
+    qty = np.frombuffer(qty_buf, dtype=float).reshape(len(ids), len(keys))
+    return classify_abcxyz(
+        months=keys,
+        ids=ids,
+        names=names,
+        qty=qty,
+        amt=qty,
+        cfg=cfg,
+        source="excel",
+        extra={"marca": marcas},
+    )
 
+@app.post("/api/abcxyz/import", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
+async def abcxyz_import(file: UploadFile = File(...)):
+    name = (file.filename or "").lower()
     cfg = load_config()
-    res = []
-    for s in series:
-        tot_qty = float(sum(s["qty_series"]))
-        mean = (tot_qty / 12.0)
-        sd = pstdev(s["qty_series"]) if any(s["qty_series"]) else 0.0
-        cv = (sd / mean) if mean > 0 else 999.0
-        res.append({
-            **s,
-            "amt_series": s["qty_series"],
-            "total_qty": tot_qty,
-            "total_revenue": tot_qty,
-            "cv": cv
-        })
 
-    total_base = sum(r["total_revenue"] for r in res)
-    use_qty_for_abc = (total_base == 0.0)
-    res.sort(key=lambda r: r["total_qty"] if use_qty_for_abc else r["total_revenue"], reverse=True)
-
-    cum = 0.0
-    base_total = sum(r["total_qty"] for r in res) if use_qty_for_abc else total_base
-
-    out = []
-    for r in res:
-        cum += (r["total_qty"] if use_qty_for_abc else r["total_revenue"])
-        share = (cum / base_total) if base_total > 0 else 0.0
-        abcl = abc_label_from_cumshare(share, cfg.a_cut, cfg.b_cut)
-        xyzl = xyz_label_from_cv(r["cv"], cfg.x_cut, cfg.y_cut)
-        out.append({**r, "ABC": abcl, "XYZ": xyzl, "ABCXYZ": abcl + xyzl})
-
-    grid = {a: {x: 0 for x in ["X", "Y", "Z"]} for a in ["A", "B", "C"]}
-    for r in out:
-        grid[r["ABC"]][r["XYZ"]] += 1
-    count = len(out)
-    perc = {a: {x: (grid[a][x] / count * 100 if count else 0) for x in ["X", "Y", "Z"]} for a in ["A", "B", "C"]}
-
-    top_series = [{"name": r["producto"], "qty": r["qty_series"]} for r in sorted(out, key=lambda r: r["total_qty"], reverse=True)[:3]]
-
-    payload = {
-        "months": keys,
-        "rows": out,
-        "matrix": {"grid": grid, "percent": perc},
-        "totals": {"revenue": total_base, "items": count},
-        "top_series": top_series,
-        "source": "excel",
-    }
+    # Parseo + clasificación en el pool acotado de importaciones (el event loop sigue atendiendo)
+    loop = asyncio.get_running_loop()
+    payload = await loop.run_in_executor(_import_executor, _abcxyz_from_upload, file.file, name, cfg)
 
-    # Guardar como "último análisis desde archivo"
-    LAST_ABCXYZ_EXCEL = payload
-    return payload
+    # Guardar como "último análisis desde archivo" y dejar listo su índice para el forecast por CSV
+    id_resultado = await _save_abcxyz("excel", payload)
+    index = await loop.run_in_executor(_import_executor, _build_csv_baseline_index, payload)
+    _lru_put(_csv_index_cache, id_resultado, index)
+    return await _abcxyz_response(payload)
 
 @app.get("/api/abcxyz/last", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
-def abcxyz_last(source: Optional[str] = None):
+async def abcxyz_last(source: Optional[str] = None):
     """
     Devuelve el último análisis ABC-XYZ de la fuente indicada.
-    Ahora BD y Excel se guardan por separado: ejecutar uno NO borra el otro.
+    BD y Excel se guardan por separado (tabla abcxyz_resultado): ejecutar uno NO borra el otro.
 
     - ?source=db    -> último análisis desde la base de datos
     - ?source=excel -> último análisis desde archivo CSV/XLSX
     - (sin source)  -> el más reciente disponible
     """
-    result = _get_last_abcxyz(source)
+    result = await _get_last_abcxyz(source)
 
     if result is None:
         if source == "db":
@@ -895,7 +1193,7 @@ def abcxyz_last(source: Optional[str] = None):
             detail = "Aún no se ha ejecutado ningún análisis ABC-XYZ."
         raise HTTPException(404, detail=detail)
 
-    return result
+    return await _abcxyz_response(result)
 
 
 # ============================================================================
@@ -963,11 +1261,11 @@ def _avg_last_k_deltas(values, k=3):
     k = min(k, len(deltas))
     return sum(deltas[-k:]) / k
 
-def _value_for_month_from_series(months: list[str], serie: list[float], ym: str) -> float | None:
+def _value_for_month_from_series(months: list[str], serie: list[float], ym: str, month_pos: dict | None = None) -> float | None:
     if not months or len(months) != len(serie):
         return None
     try:
-        i = months.index(ym)
+        i = month_pos[ym] if month_pos is not None else months.index(ym)
         return float(serie[i] or 0.0)
     except (ValueError, Exception):
         return None
@@ -1005,30 +1303,65 @@ def _extrapolate_with_trend(months: list[str], serie: list[float], ym: str) -> f
 
     return max(0.0, float(_last_nonzero(serie)))
 
-def _csv_baseline_for_item(it, target_month: str) -> float:
+def _build_csv_baseline_index(analisis: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Índice de un análisis importado desde archivo para resolver baselines en O(1):
+    - by_id:     id_producto -> primera fila con ese id
+    - by_name:   nombre normalizado (strip + lower) -> primera fila con ese nombre
+    - month_pos: 'YYYY-MM' -> posición en las series
+    """
+    months = analisis.get("months") or []
+    by_id: Dict[Any, Dict[str, Any]] = {}
+    by_name: Dict[str, Dict[str, Any]] = {}
+    for r in analisis.get("rows") or []:
+        pid = r.get("id_producto")
+        if pid is not None:
+            by_id.setdefault(pid, r)
+        nombre = (r.get("producto") or "").strip().lower()
+        if nombre:
+            by_name.setdefault(nombre, r)
+
+    month_pos: Dict[str, int] = {}
+    for i, m in enumerate(months):
+        month_pos.setdefault(m, i)
+
+    return {"months": months, "month_pos": month_pos, "by_id": by_id, "by_name": by_name}
+
+async def _get_csv_baseline_index() -> Optional[Dict[str, Any]]:
+    """Índice del último análisis importado desde archivo (se construye una vez por análisis)."""
+    id_resultado = await abcxyz_conn.read_ultimo_id("excel")
+    if id_resultado is None:
+        return None
+
+    index = _csv_index_cache.get(id_resultado)
+    if index is None:
+        analisis = await _load_abcxyz(id_resultado)
+        if analisis is None:
+            return None
+        index = await run_in_threadpool(_build_csv_baseline_index, analisis)
+    _lru_put(_csv_index_cache, id_resultado, index)
+    return index
+
+def _csv_baseline_for_item(it, target_month: str, index: Optional[Dict[str, Any]]) -> float:
     # El forecast por CSV se basa SIEMPRE en el análisis importado desde archivo
-    if LAST_ABCXYZ_EXCEL is None:
+    if index is None:
         return 0.0
 
-    rows = LAST_ABCXYZ_EXCEL.get("rows") or []
-    months = LAST_ABCXYZ_EXCEL.get("months") or []
+    months = index["months"]
     ym = _to_ym(target_month)
 
+    # Se prefiere la coincidencia por id; si no hay, la primera por nombre
     pid = getattr(it, "id_producto", None)
     nombre = (getattr(it, "producto", "") or "").strip().lower()
-    cand = None
-    for r in rows:
-        if pid not in (None, 0) and r.get("id_producto") == pid:
-            cand = r
-            break
-        if cand is None and nombre and (r.get("producto") or "").strip().lower() == nombre:
-            cand = r
+    cand = index["by_id"].get(pid) if pid not in (None, 0) else None
+    if cand is None and nombre:
+        cand = index["by_name"].get(nombre)
     if not cand:
         return 0.0
 
     serie = cand.get("amt_series") or cand.get("qty_series") or []
 
-    val_directo = _value_for_month_from_series(months, serie, ym)
+    val_directo = _value_for_month_from_series(months, serie, ym, index["month_pos"])
     if val_directo is not None and val_directo > 0:
         return float(val_directo)
 
@@ -1042,31 +1375,38 @@ def _csv_baseline_for_item(it, target_month: str) -> float:
         b = (total / 12.0) if total > 0 else 0.0
     return float(b)
 
-@app.post("/api/forecast/xgb", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=List[ForecastResponseItem])
-def forecast_xgb(payload: ForecastRequest):
-    rows_features = []
+async def _forecast_xgb(payload: ForecastRequest) -> tuple[int, List[ForecastResponseItem]]:
+    """Predice los items, guarda la corrida y devuelve (id_run, items de respuesta)."""
     baselines: List[float] = []
     meses = set()
 
+    if payload.origen == "abcxyz_db":
+        # Todos los baselines lag_1 en una sola consulta
+        lag1 = iter(await lag1_many_from_postgres(
+            [(it.id_producto, it.fecha_mes) for it in payload.items if it.id_producto]
+        ))
+    else:
+        csv_index = await _get_csv_baseline_index()
+
     for it in payload.items:
         meses.add(it.fecha_mes)
 
         if payload.origen == "abcxyz_db":
-            rows_features.append(
-                build_feature_row(
-                    producto=it.producto,
-                    marca=it.marca,
-                    fecha_mes=it.fecha_mes,
-                    pct_chg_1=it.pct_chg_1 or 0.0,
-                )
-            )
-            b = lag1_from_postgres(it.id_producto, it.fecha_mes) if it.id_producto else 0.0
+            b = next(lag1) if it.id_producto else 0.0
             baselines.append(float(b))
         else:
-            baselines.append(float(_csv_baseline_for_item(it, it.fecha_mes)))
+            baselines.append(float(_csv_baseline_for_item(it, it.fecha_mes, csv_index)))
 
     if payload.origen == "abcxyz_db":
-        y_pred = predict_batch(rows_features, baselines)
+        # Features del lote completo en columnas (tablas de lookup de runtime_xgb)
+        features = build_feature_columns(
+            productos=[it.producto for it in payload.items],
+            marcas=[it.marca for it in payload.items],
+            fechas_mes=[it.fecha_mes for it in payload.items],
+            pct_chg_1=[it.pct_chg_1 for it in payload.items],
+        )
+        # Se junta con otras requests concurrentes en un solo predict (micro-batching)
+        y_pred = await XGB_DISPATCHER.predict(features, baselines)
     else:
         y_pred = baselines
 
@@ -1083,7 +1423,6 @@ def forecast_xgb(payload: ForecastRequest):
         "periodo_fin": periodo_fin,
         "horizonte_meses": horizonte_meses,
     }
-    id_run = forecast_conn.insert_run(run_data)
 
     detalles = []
     response_items: List[ForecastResponseItem] = []
@@ -1095,7 +1434,6 @@ def forecast_xgb(payload: ForecastRequest):
         id_prod_det = (it.id_producto if it.id_producto not in (0, None) else None) if payload.origen == "abcxyz_db" else None
 
         detalles.append({
-            "id_run": id_run,
             "id_producto": id_prod_det,
             "fecha_mes": it.fecha_mes,
             "venta_predicha": float(y),
@@ -1114,37 +1452,365 @@ def forecast_xgb(payload: ForecastRequest):
             )
         )
 
-    forecast_conn.insert_detalle_many(detalles)
+    # Cabecera + detalle (COPY) en una sola transacción
+    id_run = await forecast_conn.insert_run_con_detalle(run_data, detalles)
+    return id_run, response_items
+
+@app.post("/api/forecast/xgb", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=List[ForecastResponseItem])
+async def forecast_xgb(payload: ForecastRequest):
+    _, response_items = await _forecast_xgb(payload)
     return response_items
 
+async def _forecast_recursivo(productos, marcas, meses, baseline0, pct0, on_step=None):
+    """
+    Avanza el forecast mes a mes para todos los productos a la vez (un lote por mes):
+    la predicción del mes k es el lag_1 del mes k+1 y su variación es el pct_chg_1.
+    Devuelve (predicciones, baselines), ambas de forma productos x meses.
+    on_step(k, h) (async, opcional) se llama al terminar cada mes (progreso de los trabajos).
+    """
+    n, h = len(productos), len(meses)
+    y = np.zeros((n, h), dtype=float)
+    b = np.zeros((n, h), dtype=float)
+    base = np.asarray(baseline0, dtype=float)
+    pct = np.asarray(pct0, dtype=float)
+
+    for k, mes in enumerate(meses):
+        features = build_feature_columns(
+            productos=productos,
+            marcas=marcas,
+            fechas_mes=[mes] * n,
+            pct_chg_1=pct,
+        )
+        pred = await XGB_DISPATCHER.predict(features, base)
+        y[:, k] = pred
+        b[:, k] = base
+        # variación lag_2 -> lag_1 para el mes siguiente (0 si no hay base)
+        pct = np.divide(pred - base, base, out=np.zeros(n), where=base > 0)
+        base = pred
+        if on_step is not None:
+            await on_step(k + 1, h)
+    return y, b
+
+async def _forecast_horizonte(payload: ForecastHorizonRequest, on_step=None) -> tuple[int, List[ForecastResponseItem]]:
+    """Forecast recursivo multi-horizonte; guarda la corrida y devuelve (id_run, items de respuesta)."""
+    prows = await pconn.read_producto_marca(payload.id_productos)
+    if not prows:
+        raise HTTPException(404, detail="No hay productos para proyectar.")
+
+    ids = [r[0] for r in prows]
+    productos = [r[1] for r in prows]
+    marcas = [r[2] for r in prows]
+
+    inicio = first_day_of_month(payload.fecha_inicio or add_months(date.today(), 1))
+    meses = [add_months(inicio, k) for k in range(payload.horizonte)]
+
+    # Solo el primer mes necesita datos reales: lag_1 y lag_2 de cada producto en una
+    # consulta (el lag_2 es el lag_1 del mes anterior al inicio)
+    anterior = add_months(inicio, -1)
+    lags = await lag1_many_from_postgres(
+        [(pid, inicio) for pid in ids] + [(pid, anterior) for pid in ids]
+    )
+    baseline0 = np.asarray(lags[:len(ids)], dtype=float)
+    if payload.pct_chg_1 is not None:
+        pct0 = np.full(len(ids), float(payload.pct_chg_1))
+    else:
+        # variación lag_2 -> lag_1 de cada producto (0 si no hay base), igual que en los meses siguientes
+        lag2 = np.asarray(lags[len(ids):], dtype=float)
+        pct0 = np.divide(baseline0 - lag2, lag2, out=np.zeros(len(ids)), where=lag2 > 0)
+    y, b = await _forecast_recursivo(productos, marcas, meses, baseline0, pct0, on_step)
+
+    run_data = {
+        "id_usuario": None,
+        "origen": "abcxyz_db",
+        "modelo": "xgboost",
+        "modelo_version": "XGB_2025-11-04_v1",
+        "periodo_inicio": meses[0],
+        "periodo_fin": meses[-1],
+        "horizonte_meses": len(meses),
+    }
+
+    detalles = []
+    response_items: List[ForecastResponseItem] = []
+    y_l, b_l = y.tolist(), b.tolist()
+    for i, pid in enumerate(ids):
+        for k, mes in enumerate(meses):
+            detalles.append({
+                "id_producto": pid,
+                "fecha_mes": mes,
+                "venta_predicha": y_l[i][k],
+                "baseline": b_l[i][k],
+                "categoria_abc": None,
+                "categoria_xyz": None,
+                "categoria_abcxyz": None,
+            })
+            response_items.append(
+                ForecastResponseItem(id_producto=pid, producto=productos[i], fecha_mes=mes, prediccion=y_l[i][k])
+            )
+
+    # Cabecera + detalle (COPY) en una sola transacción
+    id_run = await forecast_conn.insert_run_con_detalle(run_data, detalles)
+    return id_run, response_items
+
+@app.post("/api/forecast/xgb/horizonte", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=List[ForecastResponseItem])
+async def forecast_xgb_horizonte(payload: ForecastHorizonRequest):
+    _, response_items = await _forecast_horizonte(payload)
+    return response_items
+
+@app.get("/api/forecast/metrics", dependencies=[Depends(require_roles(ROL_ADMIN))])
+def forecast_metrics():
+    """Métricas del micro-batching de inferencia XGBoost (por worker)."""
+    return XGB_DISPATCHER.metrics()
+
+# Historial paginado por keyset, igual que las ventas: cursor de la siguiente página en X-Next-Cursor
+FORECAST_RUNS_PAGE_SIZE = 50
+FORECAST_RUNS_PAGE_MAX = 200
+FORECAST_DETALLE_PAGE_SIZE = 500
+FORECAST_DETALLE_PAGE_MAX = 5000
+
+def _decode_id_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except Exception:
+        raise HTTPException(400, detail="Cursor de paginación inválido.")
+
+def _encode_id_cursor(id_fila: int) -> str:
+    return base64.urlsafe_b64encode(str(id_fila).encode()).decode().rstrip("=")
+
+def _encode_detalle_cursor(fecha: date, producto: Optional[str], id_detalle: int) -> str:
+    # JSON: el nombre del producto puede traer cualquier carácter (o ser NULL)
+    raw = json.dumps([fecha.isoformat(), producto, id_detalle])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_detalle_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        fecha_txt, producto, id_detalle = json.loads(raw)
+        if producto is not None and not isinstance(producto, str):
+            raise ValueError(producto)
+        return date.fromisoformat(fecha_txt), producto, int(id_detalle)
+    except Exception:
+        raise HTTPException(400, detail="Cursor de paginación inválido.")
+
 @app.get("/api/forecast/history", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=List[ForecastRunInfo])
-def forecast_history():
-    rows = forecast_conn.read_runs()
+async def forecast_history(
+    response: Response,
+    limit: int = FORECAST_RUNS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    origen: Optional[str] = None,
+):
+    limit = max(1, min(limit, FORECAST_RUNS_PAGE_MAX))
+    rows = await forecast_conn.read_runs_page(limit + 1, _decode_id_cursor(cursor), origen)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_id_cursor(rows[-1][0])
+
     out: List[ForecastRunInfo] = []
     for r in rows:
         out.append(
             ForecastRunInfo(
                 id_run=r[0], creado_en=r[1], origen=r[2], modelo=r[3],
                 modelo_version=r[4], periodo_inicio=r[5], periodo_fin=r[6], horizonte_meses=r[7],
+                items=r[8], total_predicho=r[9],
             )
         )
     return out
 
+@app.get("/api/forecast/history/{id_run}/resumen", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=ForecastRunResumen)
+async def forecast_history_resumen(id_run: int):
+    rows = await forecast_conn.read_run_resumen(id_run)
+    if rows is None:
+        raise HTTPException(404, detail="Corrida no encontrada")
+
+    total = next((r for r in rows if r[1]), None)
+    por_categoria = [
+        ForecastCategoriaResumen(
+            categoria_abcxyz=r[0], items=r[2], productos=r[3], total_predicho=r[4], total_baseline=r[5],
+        )
+        for r in rows if not r[1]
+    ]
+    return ForecastRunResumen(
+        id_run=id_run,
+        items=total[2] if total else 0,
+        productos=total[3] if total else 0,
+        total_predicho=total[4] if total else 0.0,
+        total_baseline=total[5] if total else 0.0,
+        por_categoria=por_categoria,
+    )
+
 @app.get("/api/forecast/history/{id_run}", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=List[ForecastHistoryDetail])
-def forecast_history_detail(id_run: int):
-    rows = forecast_conn.read_detalle_by_run(id_run)
+async def forecast_history_detail(
+    response: Response,
+    id_run: int,
+    limit: int = FORECAST_DETALLE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    id_producto: Optional[int] = None,
+    categoria_abcxyz: Optional[str] = None,
+):
+    limit = max(1, min(limit, FORECAST_DETALLE_PAGE_MAX))
+    rows = await forecast_conn.read_detalle_page(
+        id_run, limit + 1, _decode_detalle_cursor(cursor),
+        id_producto=id_producto,
+        categoria_abcxyz=categoria_abcxyz.upper() if categoria_abcxyz else None,
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = _encode_detalle_cursor(last[4], last[3], last[0])
+
     out: List[ForecastHistoryDetail] = []
     for r in rows:
         out.append(
             ForecastHistoryDetail(
                 id_detalle=r[0], id_run=r[1], id_producto=r[2], producto=r[3],
-                fecha_mes=r[4], venta_predicha=float(r[5]), baseline=float(r[6]),
+                fecha_mes=r[4], venta_predicha=r[5], baseline=r[6],
                 categoria_abc=r[7], categoria_xyz=r[8], categoria_abcxyz=r[9],
             )
         )
     return out
 
 @app.delete("/api/forecast/history/{id_run}", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
-def delete_forecast_run(id_run: int):
-    forecast_conn.delete_run(id_run)
+async def delete_forecast_run(id_run: int):
+    await forecast_conn.delete_run(id_run)
     return JSONResponse(content={"ok": True, "id_run": id_run}, status_code=200)
+
+# ============================================================================
+# --------- ENDPOINTS: TRABAJOS EN SEGUNDO PLANO ---------
+# ============================================================================
+# Corridas largas (forecast de todo el catálogo, ABC-XYZ) fuera del request HTTP:
+# el POST encola y devuelve id_job; el avance se consulta en /api/jobs/{id_job}.
+
+async def _job_forecast_xgb(id_job: int, intentos: int, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    id_run, items = await _forecast_xgb(ForecastRequest(**parametros))
+    return {"id_run": id_run, "items": len(items)}
+
+async def _job_forecast_horizonte(id_job: int, intentos: int, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    async def on_step(k: int, h: int):
+        await job_conn.update_progreso(id_job, intentos, k / h, f"Mes {k} de {h}")
+
+    id_run, items = await _forecast_horizonte(ForecastHorizonRequest(**parametros), on_step)
+    return {"id_run": id_run, "items": len(items)}
+
+async def _job_abcxyz_run(id_job: int, intentos: int, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    id_resultado, payload = await _abcxyz_run_db()
+    return {"id_resultado": id_resultado, "items": payload["totals"]["items"]}
+
+_JOB_HANDLERS = {
+    "forecast_xgb": _job_forecast_xgb,
+    "forecast_horizonte": _job_forecast_horizonte,
+    "abcxyz_run": _job_abcxyz_run,
+}
+
+async def _job_heartbeat(id_job: int, intentos: int) -> None:
+    """Latido mientras corre el handler (los que no informan avance también se ven vivos)."""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            if not await job_conn.touch(id_job, intentos):
+                print(f"❌ Job {id_job}: otro worker lo reclamó, se deja de latir")
+                return
+        except Exception as e:
+            print(f"❌ Job {id_job}: latido falló: {e}")
+
+async def _run_job(id_job: int, tipo: str, parametros: Dict[str, Any], intentos: int) -> None:
+    heartbeat = asyncio.create_task(_job_heartbeat(id_job, intentos))
+    try:
+        resultado = await _JOB_HANDLERS[tipo](id_job, intentos, parametros)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        error = str(getattr(e, "detail", None) or e) or e.__class__.__name__
+        print(f"❌ Job {id_job} ({tipo}) falló: {error}")
+        if not await job_conn.finish_error(id_job, intentos, error):
+            print(f"❌ Job {id_job}: ya no pertenece a este worker, no se guarda el error")
+        return
+    finally:
+        heartbeat.cancel()
+    if await job_conn.finish_ok(id_job, intentos, resultado):
+        print(f"✅ Job {id_job} ({tipo}) terminado")
+    else:
+        print(f"❌ Job {id_job}: ya no pertenece a este worker, no se guarda el resultado")
+
+async def _job_worker() -> None:
+    """Toma trabajos de la cola hasta que se cancela o se pide parar (al apagar el worker)."""
+    while not _job_parar.is_set():
+        try:
+            # Se limpia ANTES de consultar: un submit que llegue en medio no se pierde
+            _job_wakeup.clear()
+            job = await job_conn.claim_next(JOB_STALE_SECONDS, JOB_MAX_INTENTOS)
+            if job is None:
+                # Sin trabajos: espera un submit de este proceso o revisa de nuevo (otros procesos)
+                try:
+                    await asyncio.wait_for(_job_wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await _run_job(*job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Un error de la cola (p. ej. la BD caída al guardar el resultado) no debe matar
+            # al worker: el trabajo queda 'en_curso' y se reintenta al vencer JOB_STALE_SECONDS
+            print(f"❌ Cola de trabajos: {e}")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+async def _submit_job(tipo: str, parametros: Dict[str, Any]) -> JSONResponse:
+    id_job = await job_conn.insert_job(tipo, jsonable_encoder(parametros))
+    if _job_wakeup is not None:
+        _job_wakeup.set()
+    return JSONResponse(content={"id_job": id_job, "estado": "pendiente"}, status_code=HTTP_202_ACCEPTED)
+
+@app.post("/api/jobs/forecast/xgb", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], status_code=HTTP_202_ACCEPTED)
+async def job_forecast_xgb(payload: ForecastRequest):
+    return await _submit_job("forecast_xgb", payload.dict())
+
+@app.post("/api/jobs/forecast/horizonte", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], status_code=HTTP_202_ACCEPTED)
+async def job_forecast_horizonte(payload: ForecastHorizonRequest):
+    return await _submit_job("forecast_horizonte", payload.dict())
+
+@app.post("/api/jobs/abcxyz/run", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], status_code=HTTP_202_ACCEPTED)
+async def job_abcxyz_run():
+    return await _submit_job("abcxyz_run", {})
+
+@app.get("/api/jobs/{id_job}", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))], response_model=JobInfo)
+async def job_estado(id_job: int):
+    row = await job_conn.read_job(id_job)
+    if not row:
+        raise HTTPException(404, detail="Trabajo no encontrado")
+    return JobInfo(
+        id_job=row[0], tipo=row[1], estado=row[2], progreso=row[4], mensaje=row[5],
+        resultado=row[6], error=row[7], intentos=row[8], creado_en=row[9],
+        iniciado_en=row[10], actualizado_en=row[11], terminado_en=row[12],
+    )
+
+@app.get("/api/jobs/{id_job}/resultado", dependencies=[Depends(require_roles(ROL_ADMIN, ROL_USER))])
+async def job_resultado(
+    response: Response,
+    id_job: int,
+    limit: int = FORECAST_DETALLE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    """
+    Resultado de un trabajo terminado: el detalle de la corrida de forecast (paginado
+    como /api/forecast/history/{id_run}) o el análisis ABC-XYZ guardado.
+    """
+    row = await job_conn.read_job(id_job)
+    if not row:
+        raise HTTPException(404, detail="Trabajo no encontrado")
+    estado, resultado = row[2], row[6] or {}
+    if estado == "error":
+        raise HTTPException(409, detail=f"El trabajo falló: {row[7]}")
+    if estado != "ok":
+        raise HTTPException(409, detail=f"El trabajo aún no terminó (estado: {estado})")
+
+    if "id_run" in resultado:
+        return await forecast_history_detail(response, resultado["id_run"], limit, cursor)
+
+    payload = await _load_abcxyz(resultado["id_resultado"])
+    if payload is None:
+        raise HTTPException(404, detail="El análisis ABC-XYZ ya no está disponible")
+    return await _abcxyz_response(payload)
@@ -0,0 +1,150 @@
+# ml/abcxyz_engine.py
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from schema.abcxyz_schema import ABCXYZConfigSchema, month_key_from_date
+
+ABC_LABELS = ["A", "B", "C"]
+XYZ_LABELS = ["X", "Y", "Z"]
+CV_SIN_DEMANDA = 999.0   # CV que se asigna cuando la media es 0
+
+
+# =========================
+# Construcción de la matriz productos x meses
+# =========================
+
+def matrix_from_monthly_totals(
+    ids: Sequence[int],
+    months: List[str],
+    mrows: Iterable[tuple],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Arma las matrices (cantidad, importe) de forma productos x meses a partir de filas
+    (id_producto, mes, cantidad, importe). Se ignoran productos o meses fuera de ids/months.
+    """
+    pos = {pid: i for i, pid in enumerate(ids)}
+    col = {mk: j for j, mk in enumerate(months)}
+
+    ii, jj, qv, av = [], [], [], []
+    for pid, mes, qty, amt in mrows:
+        i = pos.get(pid)
+        j = col.get(month_key_from_date(mes))
+        if i is None or j is None:
+            continue
+        ii.append(i)
+        jj.append(j)
+        qv.append(float(qty or 0.0))
+        av.append(float(amt or 0.0))
+
+    qty_m = np.zeros((len(ids), len(months)), dtype=float)
+    amt_m = np.zeros((len(ids), len(months)), dtype=float)
+    np.add.at(qty_m, (ii, jj), qv)
+    np.add.at(amt_m, (ii, jj), av)
+    return qty_m, amt_m
+
+
+# =========================
+# Clasificación
+# =========================
+
+def _seq_sum(a: np.ndarray, axis: int = -1) -> np.ndarray:
+    """
+    Suma secuencial (cumsum) para obtener exactamente el mismo redondeo que sum() de Python;
+    np.sum usa suma por pares y puede diferir en el último decimal (y cambiar empates en el orden).
+    """
+    if a.shape[axis] == 0:
+        return np.zeros(np.delete(a.shape, axis), dtype=float)
+    return np.take(np.cumsum(a, axis=axis), -1, axis=axis)
+
+
+def classify_abcxyz(
+    *,
+    months: List[str],
+    ids: Sequence[Any],
+    names: Sequence[str],
+    qty: np.ndarray,
+    amt: np.ndarray,
+    cfg: ABCXYZConfigSchema,
+    source: str,
+    extra: Optional[Dict[str, Sequence[Any]]] = None,
+    top_n: int = 3,
+) -> Dict[str, Any]:
+    """
+    Clasificación ABC-XYZ vectorizada sobre una matriz productos x meses.
+
+    - qty: cantidades (n x meses), definen el CV (XYZ)
+    - amt: importes   (n x meses), definen el ABC (si el importe total es 0, se usa la cantidad)
+    - extra: columnas adicionales por fila que se copian al resultado (ej. {"marca": [...]})
+
+    Devuelve el mismo payload que consumen /api/abcxyz/run e /api/abcxyz/import:
+    months, rows (ordenadas por ABC), matrix (grid/percent), totals y top_series.
+    """
+    qty = np.asarray(qty, dtype=float).reshape(len(ids), len(months))
+    amt = np.asarray(amt, dtype=float).reshape(len(ids), len(months))
+    n_months = float(len(months))
+
+    tot_qty = _seq_sum(qty, axis=1)
+    tot_amt = _seq_sum(amt, axis=1)
+    total_revenue = float(_seq_sum(tot_amt)) if len(ids) else 0.0
+
+    # CV = desviación estándar poblacional / media (999 si la media es 0)
+    mean = tot_qty / n_months
+    sd = qty.std(axis=1)
+    pos_mean = mean > 0
+    cv = np.full(len(ids), CV_SIN_DEMANDA)
+    cv[pos_mean] = sd[pos_mean] / mean[pos_mean]
+
+    # ABC: orden descendente estable (igual que sort(reverse=True)) y participación acumulada
+    use_qty_for_abc = (total_revenue == 0.0)
+    key = tot_qty if use_qty_for_abc else tot_amt
+    order = np.argsort(-key, kind="stable")
+    cum = np.cumsum(key[order])
+    base_total = float(cum[-1]) if use_qty_for_abc and len(cum) else total_revenue
+    share = cum / base_total if base_total > 0 else np.zeros(len(order))
+
+    abc_idx = np.where(share <= cfg.a_cut, 0, np.where(share <= cfg.b_cut, 1, 2))
+    cv_sorted = cv[order]
+    xyz_idx = np.where(cv_sorted <= cfg.x_cut, 0, np.where(cv_sorted <= cfg.y_cut, 1, 2))
+
+    # Matriz 3x3 de conteos y porcentajes
+    counts = np.bincount(abc_idx * 3 + xyz_idx, minlength=9).reshape(3, 3).tolist()
+    count = len(order)
+    grid = {a: {x: counts[i][j] for j, x in enumerate(XYZ_LABELS)} for i, a in enumerate(ABC_LABELS)}
+    perc = {
+        a: {x: (grid[a][x] / count * 100 if count else 0) for x in XYZ_LABELS}
+        for a in ABC_LABELS
+    }
+
+    # Filas de salida (en orden ABC); las columnas extra van después de "producto"
+    idx = order.tolist()
+    cols = {
+        "id_producto": [ids[i] for i in idx],
+        "producto": [names[i] for i in idx],
+        **{col: [values[i] for i in idx] for col, values in (extra or {}).items()},
+        "qty_series": qty[order].tolist(),
+        "amt_series": amt[order].tolist(),
+        "total_qty": tot_qty[order].tolist(),
+        "total_revenue": tot_amt[order].tolist(),
+        "cv": cv_sorted.tolist(),
+        "ABC": [ABC_LABELS[i] for i in abc_idx.tolist()],
+        "XYZ": [XYZ_LABELS[i] for i in xyz_idx.tolist()],
+    }
+    cols["ABCXYZ"] = [a + x for a, x in zip(cols["ABC"], cols["XYZ"])]
+    names_cols = list(cols)
+    rows = [dict(zip(names_cols, vals)) for vals in zip(*cols.values())]
+
+    # Top por cantidad total (estable respecto al orden ABC)
+    top = np.argsort(-tot_qty[order], kind="stable")[:top_n].tolist()
+    top_series = [{"name": rows[k]["producto"], "qty": rows[k]["qty_series"]} for k in top]
+
+    return {
+        "months": months,
+        "rows": rows,
+        "matrix": {"grid": grid, "percent": perc},
+        "totals": {"revenue": total_revenue, "items": count},
+        "top_series": top_series,
+        "source": source,
+    }
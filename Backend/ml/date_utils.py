@@ -14,3 +14,11 @@ def prev_month_start(d: date) -> date:
         m = 12
         y -= 1
     return date(y, m, 1)
+
+def add_months(d: date, n: int) -> date:
+    """
+    Primer día del mes que está n meses después de d.
+    Ej: add_months(2025-11-20, 3) -> 2026-02-01
+    """
+    t = d.year * 12 + (d.month - 1) + n
+    return date(t // 12, t % 12 + 1, 1)
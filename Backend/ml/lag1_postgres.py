@@ -1,102 +1,79 @@
 # ml/lag1_postgres.py
 from datetime import date
+from typing import List, Tuple
 
-from model.venta_connection import VentaConnection
+from config.database import connection
 from .runtime_xgb import GLOBAL_MEAN
-from .date_utils import first_day_of_month, prev_month_start
+from .date_utils import first_day_of_month
 
 
-venta_conn = VentaConnection()
-
-
-def lag1_from_postgres(id_producto: int, fecha_mes: date) -> float:
+async def lag1_from_postgres(id_producto: int, fecha_mes: date) -> float:
     """
-    Calcula el baseline tipo lag_1 para (id_producto, fecha_mes) a partir de la tabla 'venta',
-    usando **importe_total** como medida de venta mensual.
+    Calcula el baseline tipo lag_1 para (id_producto, fecha_mes) a partir del rollup
+    'venta_mensual' (ventas activas por producto y mes), usando **importe_total** como
+    medida de venta mensual.
 
     Lógica:
-      1) Ventas (importe_total) del mes anterior (agregado por mes)
+      1) Ventas (importe_total) del mes anterior
       2) Si no existe ese mes, toma la última venta mensual anterior
       3) Si no existe historial previo, usa la media mensual del producto (importe_total)
       4) Si el producto nunca vendió, usa la media mensual global (importe_total)
 
     Devuelve siempre un float (si todo falla, GLOBAL_MEAN).
     """
-    month_start = first_day_of_month(fecha_mes)
-    prev_start = prev_month_start(month_start)
+    return (await lag1_many_from_postgres([(id_producto, fecha_mes)]))[0]
 
-    conn = venta_conn.conn
-    if conn is None:
-        # si por algún motivo no se conectó, devolvemos GLOBAL_MEAN
-        return float(GLOBAL_MEAN)
 
-    with conn.cursor() as cur:
-        # 1) venta (importe_total) del mes anterior
-        cur.execute(
-            """
-            SELECT SUM(importe_total)::float AS venta_mensual
-            FROM venta
-            WHERE id_producto = %s
-              AND estado = 1
-              AND date_trunc('month', fecha) = date_trunc('month', %s::date);
-            """,
-            (id_producto, prev_start),
-        )
-        row = cur.fetchone()
-        if row and row[0] is not None:
-            return float(row[0])
+async def lag1_many_from_postgres(pares: List[Tuple[int, date]]) -> List[float]:
+    """
+    Versión por lotes de lag1_from_postgres: resuelve toda la cadena de fallback
+    para todos los pares (id_producto, fecha_mes) en una sola consulta.
+    Devuelve los baselines en el mismo orden que 'pares'.
 
-        # 2) última venta mensual anterior a 'fecha_mes'
-        cur.execute(
-            """
-            SELECT SUM(importe_total)::float AS venta_mensual
-            FROM venta
-            WHERE id_producto = %s
-              AND estado = 1
-              AND fecha < %s::date
-            GROUP BY date_trunc('month', fecha)
-            ORDER BY date_trunc('month', fecha) DESC
-            LIMIT 1;
-            """,
-            (id_producto, month_start),
-        )
-        row = cur.fetchone()
-        if row and row[0] is not None:
-            return float(row[0])
+    El paso 1 (mes anterior) queda cubierto por el paso 2: si el mes anterior tiene
+    ventas, es justamente la última venta mensual antes de 'fecha_mes'.
+    """
+    if not pares:
+        return []
 
-        # 3) media mensual del producto (en importe_total)
-        cur.execute(
-            """
-            SELECT AVG(mensual)::float
-            FROM (
-              SELECT SUM(importe_total) AS mensual
-              FROM venta
-              WHERE id_producto = %s
-                AND estado = 1
-              GROUP BY date_trunc('month', fecha)
-            ) t;
-            """,
-            (id_producto,),
-        )
-        row = cur.fetchone()
-        if row and row[0] is not None:
-            return float(row[0])
+    ids = [int(pid) for pid, _ in pares]
+    meses = [first_day_of_month(f) for _, f in pares]
 
-        # 4) media mensual global (en importe_total)
-        cur.execute(
-            """
-            SELECT AVG(mensual)::float
-            FROM (
-              SELECT SUM(importe_total) AS mensual
-              FROM venta
-              WHERE estado = 1
-              GROUP BY id_producto, date_trunc('month', fecha)
-            ) t;
+    async with connection() as conn, conn.cursor() as cur:
+        await cur.execute(
             """
+            WITH req AS (
+                SELECT r.ord, r.id_producto, r.mes
+                FROM unnest(%(ids)s::int[], %(meses)s::date[])
+                     WITH ORDINALITY AS r(id_producto, mes, ord)
+            ),
+            media_producto AS (
+                SELECT id_producto, AVG(importe_total)::float AS media
+                FROM venta_mensual
+                WHERE id_producto = ANY(%(ids)s::int[])
+                GROUP BY id_producto
+            )
+            SELECT req.ord,
+                   COALESCE(ult.venta_mensual, mp.media, glob.media) AS baseline
+            FROM req
+            -- 1) y 2) última venta mensual anterior a 'fecha_mes'
+            LEFT JOIN LATERAL (
+                SELECT vm.importe_total::float AS venta_mensual
+                FROM venta_mensual vm
+                WHERE vm.id_producto = req.id_producto
+                  AND vm.mes < req.mes
+                ORDER BY vm.mes DESC
+                LIMIT 1
+            ) ult ON true
+            -- 3) media mensual del producto
+            LEFT JOIN media_producto mp ON mp.id_producto = req.id_producto
+            -- 4) media mensual global
+            CROSS JOIN (SELECT AVG(importe_total)::float AS media FROM venta_mensual) glob
+            ORDER BY req.ord;
+            """,
+            {"ids": ids, "meses": meses},
         )
-        row = cur.fetchone()
-        if row and row[0] is not None:
-            return float(row[0])
+        rows = await cur.fetchall()
 
     # si absolutamente todo falla, usamos el GLOBAL_MEAN del training
-    return float(GLOBAL_MEAN)
+    return [float(r[1]) if r[1] is not None else float(GLOBAL_MEAN) for r in rows]
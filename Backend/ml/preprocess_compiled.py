@@ -0,0 +1,280 @@
+# ml/preprocess_compiled.py
+"""
+Versión "compilada" en NumPy del preprocess.pkl (ColumnTransformer de scikit-learn).
+
+Lee los parámetros ya ajustados (imputers, scaler, one-hot) y los aplica con operaciones
+de arrays, sin validaciones ni DataFrames por llamada. Solo se usa si:
+  1) el pipeline tiene únicamente pasos soportados, y
+  2) pasa la verificación de paridad contra PREPROCESS.transform con datos aleatorios.
+Si algo de eso falla, runtime_xgb sigue usando el pipeline original (con un aviso en el log).
+
+Verificación completa (varias semillas, desde Backend/):  python -m pytest tests/test_preprocess_parity.py
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+PARITY_ATOL = 1e-9
+
+
+class UnsupportedPreprocess(Exception):
+    pass
+
+
+# =========================
+# Normalización de categorías
+# =========================
+
+# Marca de "faltante" para el imputer. Ojo: igual que scikit-learn con missing_values=NaN,
+# solo NaN/NaT cuentan como faltantes; None es un valor más (categoría desconocida).
+_MISSING = object()
+
+
+def _is_missing(v: Any) -> bool:
+    if v is None or v is pd.NaT:
+        return True
+    return isinstance(v, float) and math.isnan(v)
+
+
+def _cat_key(v: Any) -> Any:
+    """Clave de diccionario comparable entre Timestamp/datetime64 (ns enteros) y strings."""
+    if isinstance(v, (pd.Timestamp, np.datetime64)):
+        return int(np.datetime64(v, "ns").astype(np.int64))
+    return v
+
+
+def _column_keys(values: Any) -> List[Any]:
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        ints = arr.astype("datetime64[ns]").astype(np.int64).tolist()
+        nat = np.isnat(arr).tolist()
+        return [_MISSING if m else k for k, m in zip(ints, nat)]
+    return [
+        _MISSING if (isinstance(v, float) and math.isnan(v)) or v is pd.NaT else _cat_key(v)
+        for v in arr.tolist()
+    ]
+
+
+# =========================
+# Bloques compilados
+# =========================
+
+class _NumBlock:
+    def __init__(self, idx, fill, mean, scale, start):
+        self.idx = np.asarray(idx, dtype=np.intp)
+        self.fill = fill
+        self.mean = mean
+        self.scale = scale
+        self.start = start
+        self.stop = start + len(idx)
+
+
+class _CatColumn:
+    def __init__(self, name, mapping, fill_key, offset, unknown_error):
+        self.name = name
+        self.mapping = mapping
+        self.fill_key = fill_key
+        self.offset = offset
+        self.unknown_error = unknown_error
+
+
+def _split_steps(transformer) -> List[Any]:
+    if isinstance(transformer, Pipeline):
+        return [step for _, step in transformer.steps if step not in (None, "passthrough")]
+    if transformer == "passthrough":
+        return []
+    return [transformer]
+
+
+def _imputer_fill(imp: SimpleImputer) -> np.ndarray:
+    mv = imp.missing_values
+    if not (isinstance(mv, float) and math.isnan(mv)):
+        raise UnsupportedPreprocess("SimpleImputer con missing_values distinto de NaN")
+    if getattr(imp, "add_indicator", False):
+        raise UnsupportedPreprocess("SimpleImputer con add_indicator")
+    return np.asarray(imp.statistics_)
+
+
+class CompiledPreprocess:
+    """
+    transform(features) con features = {"num": matriz (n x num_columns), <col categórica>: array, ...}
+    (el formato de runtime_xgb.build_feature_columns). Devuelve la misma matriz que PREPROCESS.
+    """
+
+    def __init__(self, preprocess: ColumnTransformer, num_columns: Sequence[str]):
+        if not isinstance(preprocess, ColumnTransformer):
+            raise UnsupportedPreprocess("se esperaba un ColumnTransformer")
+        if getattr(preprocess, "sparse_output_", False):
+            raise UnsupportedPreprocess("salida dispersa")
+
+        num_pos = {c: i for i, c in enumerate(num_columns)}
+        self.num_columns = list(num_columns)
+        self.feature_names_in = list(getattr(preprocess, "feature_names_in_", []))
+        self.num_blocks: List[_NumBlock] = []
+        self.cat_columns: List[_CatColumn] = []
+        self.cat_categories: Dict[str, np.ndarray] = {}
+
+        offset = 0
+        for name, transformer, cols in preprocess.transformers_:
+            if transformer == "drop" or len(cols) == 0:
+                continue
+            cols = list(cols)
+            steps = _split_steps(transformer)
+
+            if steps and isinstance(steps[-1], OneHotEncoder):
+                offset = self._compile_cat(steps, cols, offset)
+            else:
+                offset = self._compile_num(steps, cols, num_pos, offset)
+
+        self.n_out = offset
+        n_expected = len(preprocess.get_feature_names_out())
+        if self.n_out != n_expected:
+            raise UnsupportedPreprocess(f"ancho de salida {self.n_out} != {n_expected}")
+
+    def _compile_num(self, steps, cols, num_pos, offset) -> int:
+        missing = [c for c in cols if c not in num_pos]
+        if missing:
+            raise UnsupportedPreprocess(f"columnas numéricas desconocidas: {missing}")
+
+        fill = mean = scale = None
+        for step in steps:
+            if isinstance(step, SimpleImputer) and fill is None and mean is None and scale is None:
+                fill = _imputer_fill(step)
+                if np.isnan(fill.astype(float)).any():
+                    raise UnsupportedPreprocess("imputer con estadísticas vacías")
+                fill = fill.astype(float)
+            elif isinstance(step, StandardScaler) and mean is None and scale is None:
+                mean = np.asarray(step.mean_, dtype=float) if step.with_mean else None
+                scale = np.asarray(step.scale_, dtype=float) if step.with_std else None
+            else:
+                raise UnsupportedPreprocess(f"paso numérico no soportado: {step!r}")
+
+        self.num_blocks.append(_NumBlock([num_pos[c] for c in cols], fill, mean, scale, offset))
+        return offset + len(cols)
+
+    def _compile_cat(self, steps, cols, offset) -> int:
+        *pre, ohe = steps
+        fills: List[Any] = [None] * len(cols)
+        for step in pre:
+            if isinstance(step, SimpleImputer):
+                fills = [_cat_key(v) for v in _imputer_fill(step).tolist()]
+            else:
+                raise UnsupportedPreprocess(f"paso categórico no soportado: {step!r}")
+
+        if ohe.drop_idx_ is not None or getattr(ohe, "_infrequent_enabled", False):
+            raise UnsupportedPreprocess("OneHotEncoder con drop/infrequent")
+
+        for col, cats, fill_key in zip(cols, ohe.categories_, fills):
+            mapping = {}
+            for j, v in enumerate(cats.tolist()):
+                if _is_missing(v):
+                    raise UnsupportedPreprocess("categoría faltante en OneHotEncoder")
+                mapping[_cat_key(v)] = j
+            self.cat_columns.append(
+                _CatColumn(col, mapping, fill_key, offset, ohe.handle_unknown == "error")
+            )
+            self.cat_categories[col] = cats
+            offset += len(cats)
+        return offset
+
+    # -------- transform --------
+    def transform(self, features: Dict[str, Any]) -> np.ndarray:
+        num = np.asarray(features["num"], dtype=float)
+        n = num.shape[0]
+        out = np.zeros((n, self.n_out), dtype=float)
+
+        for blk in self.num_blocks:
+            x = num[:, blk.idx]   # indexado avanzado: copia, no toca features["num"]
+            if blk.fill is not None:
+                rows, cols = np.nonzero(np.isnan(x))
+                if len(rows):
+                    x[rows, cols] = blk.fill[cols]
+            if blk.mean is not None:
+                x -= blk.mean
+            if blk.scale is not None:
+                x /= blk.scale
+            out[:, blk.start:blk.stop] = x
+
+        for col in self.cat_columns:
+            keys = _column_keys(features[col.name])
+            pos = np.fromiter(
+                (col.mapping.get(col.fill_key if k is _MISSING else k, -1) for k in keys),
+                dtype=np.intp,
+                count=n,
+            )
+            known = pos >= 0
+            if col.unknown_error and not known.all():
+                raise ValueError(f"Categoría desconocida en '{col.name}'")
+            out[np.nonzero(known)[0], col.offset + pos[known]] = 1.0
+
+        return out
+
+
+# =========================
+# Paridad contra scikit-learn
+# =========================
+
+def _random_features(compiled: CompiledPreprocess, n: int, seed: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(seed)
+    num = rng.normal(0.0, 1.0, size=(n, len(compiled.num_columns))) * rng.choice([1.0, 10.0, 1e3], size=(n, 1))
+    num[rng.random(num.shape) < 0.05] = np.nan
+    features: Dict[str, Any] = {"num": num}
+
+    for col in compiled.cat_columns:
+        cats = compiled.cat_categories[col.name]
+        if len(cats) and isinstance(cats[0], (pd.Timestamp, np.datetime64)):
+            known = np.asarray(cats, dtype="datetime64[ns]")
+            other = np.datetime64("2019-01-01", "ns") + rng.integers(0, 3000, size=n).astype("timedelta64[D]")
+            features[col.name] = np.where(rng.random(n) < 0.6, rng.choice(known, size=n), other)
+        else:
+            pool = list(cats.tolist()) + ["__desconocido__", None, float("nan")]
+            features[col.name] = np.asarray([pool[i] for i in rng.integers(0, len(pool), size=n)], dtype=object)
+    return features
+
+
+def check_parity(compiled: CompiledPreprocess, preprocess: ColumnTransformer, n: int = 256, seed: int = 0) -> float:
+    """
+    Compara compiled.transform vs preprocess.transform con entradas aleatorias
+    (incluye NaN, categorías desconocidas y faltantes). Devuelve la diferencia absoluta máxima.
+    """
+    features = _random_features(compiled, n, seed)
+    data = {c: features["num"][:, j] for j, c in enumerate(compiled.num_columns)}
+    data.update({c.name: features[c.name] for c in compiled.cat_columns})
+    order = compiled.feature_names_in or list(data)
+    df = pd.DataFrame(data)[order]
+
+    expected = np.asarray(preprocess.transform(df), dtype=float)
+    got = compiled.transform(features)
+    if expected.shape != got.shape:
+        return float("inf")
+    return float(np.max(np.abs(expected - got))) if expected.size else 0.0
+
+
+def compile_preprocess(preprocess, num_columns: Sequence[str]) -> Optional[CompiledPreprocess]:
+    """
+    Compila el pipeline y lo valida. Devuelve None (y se usa el pipeline original)
+    si tiene pasos no soportados o si no pasa la verificación de paridad.
+    Nunca lanza: se llama al importar runtime_xgb y no debe impedir que arranque la API.
+    """
+    try:
+        compiled = CompiledPreprocess(preprocess, num_columns)
+        diff = check_parity(compiled, preprocess)
+    except Exception as e:
+        print(f"⚠️ Preprocess compilado no disponible ({e}); se usa scikit-learn")
+        return None
+
+    if not diff <= PARITY_ATOL:
+        print(f"⚠️ Preprocess compilado descartado: diferencia {diff:g} vs scikit-learn")
+        return None
+
+    print("✅ Preprocess compilado a NumPy (paridad verificada)")
+    return compiled
+
@@ -3,15 +3,20 @@ from __future__ import annotations
 
 from pathlib import Path
 from datetime import date, datetime
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Sequence, Union
+import asyncio
 import math
 import json
+import os
+import time
 
 import numpy as np
 import pandas as pd
 import joblib
 from xgboost import XGBRegressor
 
+from .preprocess_compiled import compile_preprocess
+
 # =========================
 # Carga de artifacts
 # =========================
@@ -44,6 +49,60 @@ PREPROCESS = joblib.load(ART_DIR / "preprocess.pkl")
 MODEL = XGBRegressor()
 MODEL.load_model(str(ART_DIR / "xgb_model.json"))
 
+# Booster directo: inplace_predict evita las validaciones del wrapper sklearn en cada llamada.
+# Mismo rango de árboles que usaría MODEL.predict (best_iteration si hubo early stopping).
+BOOSTER = MODEL.get_booster()
+try:
+    ITERATION_RANGE = (0, int(MODEL.best_iteration) + 1)
+except AttributeError:
+    ITERATION_RANGE = (0, 0)
+
+
+# =========================
+# Tablas de lookup (precalculadas desde FMAPS)
+# =========================
+#
+# Cada producto/marca conocido tiene un código; el último código de cada tabla
+# es "desconocido" y replica los defaults de build_feature_row (GLOBAL_MEAN, factor 1.0).
+# Las columnas de meses van de 0..12 (la 0 no se usa) para indexar directo con el mes.
+
+NUM_COLUMNS = [c for c in XTR_RAW_COLUMNS if c not in ("marca", "producto", "fecha_mes")]
+
+PRODUCT_CODES: Dict[str, int] = {}
+for _key in list(KEY_MEAN_MAP) + [k.rsplit(":", 1)[0] for k in KEY_MONTH_MAP]:
+    PRODUCT_CODES.setdefault(_key, len(PRODUCT_CODES))
+PRODUCT_UNKNOWN = len(PRODUCT_CODES)
+
+_TE_MARCA_MAP = CAT_MEAN_MAPS.get("marca", {})
+MARCA_CODES: Dict[str, int] = {m: i for i, m in enumerate(_TE_MARCA_MAP)}
+MARCA_UNKNOWN = len(MARCA_CODES)
+
+
+def _build_lookup_tables():
+    n_prod = PRODUCT_UNKNOWN + 1
+    key_mean = np.full(n_prod, GLOBAL_MEAN, dtype=float)
+    key_month_factor = np.ones((n_prod, 13), dtype=float)
+    for prod, code in PRODUCT_CODES.items():
+        km = float(KEY_MEAN_MAP.get(prod, GLOBAL_MEAN))
+        key_mean[code] = km
+        for month in range(1, 13):
+            kmm = float(KEY_MONTH_MAP.get(f"{prod}:{month}", km))
+            key_month_factor[code, month] = kmm / km if km > 0 else 1.0
+
+    month_factor_glob = np.ones(13, dtype=float)
+    month_sin = np.zeros(13, dtype=float)
+    month_cos = np.zeros(13, dtype=float)
+    for month in range(1, 13):
+        mg = float(MONTH_GLOB_MAP.get(str(month), GLOBAL_MEAN))
+        month_factor_glob[month] = mg / GLOBAL_MEAN if GLOBAL_MEAN > 0 else 1.0
+        month_sin[month], month_cos[month] = _month_sin_cos(month)
+
+    te_marca = np.full(MARCA_UNKNOWN + 1, GLOBAL_MEAN, dtype=float)
+    for marca, code in MARCA_CODES.items():
+        te_marca[code] = float(_TE_MARCA_MAP[marca])
+
+    return key_mean, key_month_factor, month_factor_glob, month_sin, month_cos, te_marca
+
 
 # =========================
 # Helpers de fechas
@@ -60,6 +119,19 @@ def _month_sin_cos(month: int) -> tuple[float, float]:
     return math.sin(ang), math.cos(ang)
 
 
+(
+    LK_KEY_MEAN,
+    LK_KEY_MONTH_FACTOR,
+    LK_MONTH_FACTOR_GLOB,
+    LK_MONTH_SIN,
+    LK_MONTH_COS,
+    LK_TE_MARCA,
+) = _build_lookup_tables()
+
+# Transform equivalente en NumPy (None si no se pudo compilar o no pasó la paridad)
+PREPROCESS_FAST = compile_preprocess(PREPROCESS, NUM_COLUMNS)
+
+
 # =========================
 # Baseline (lag_1)
 # =========================
@@ -170,6 +242,66 @@ def build_feature_row(
     return {col: row[col] for col in XTR_RAW_COLUMNS}
 
 
+def encode_productos(productos: Sequence[str]) -> np.ndarray:
+    return np.fromiter((PRODUCT_CODES.get(p, PRODUCT_UNKNOWN) for p in productos), dtype=np.intp, count=len(productos))
+
+
+def encode_marcas(marcas: Sequence[str]) -> np.ndarray:
+    return np.fromiter((MARCA_CODES.get(m, MARCA_UNKNOWN) for m in marcas), dtype=np.intp, count=len(marcas))
+
+
+def build_feature_columns(
+    *,
+    productos: Sequence[str],
+    marcas: Sequence[str],
+    fechas_mes: Sequence[Union[str, date, datetime]],
+    pct_chg_1: Sequence[float | None],
+) -> Dict[str, Any]:
+    """
+    Versión columnar de build_feature_row para un lote completo.
+
+    Las features numéricas se llenan en una matriz preasignada (n x NUM_COLUMNS) con las
+    tablas de lookup; las categóricas quedan como columnas (arrays) listas para PREPROCESS.
+    Devuelve {"num": matriz, "marca": ..., "producto": ..., "fecha_mes": datetime64[ns]}.
+    """
+    n = len(productos)
+    fechas = np.asarray(fechas_mes, dtype="datetime64[ns]").reshape(n)
+    ym = fechas.astype("datetime64[M]").astype(np.int64)
+    year = ym // 12 + 1970
+    month = ym % 12 + 1
+
+    prod_codes = encode_productos(productos)
+    marca_codes = encode_marcas(marcas)
+
+    num = np.empty((n, len(NUM_COLUMNS)), dtype=float)
+    cols = {c: num[:, j] for j, c in enumerate(NUM_COLUMNS)}
+    cols["pct_chg_1"][:] = [float(x or 0.0) for x in pct_chg_1]
+    cols["year"][:] = year
+    cols["month"][:] = month
+    cols["qtr"][:] = (month - 1) // 3 + 1
+    cols["key_mean_train"][:] = LK_KEY_MEAN[prod_codes]
+    cols["key_month_factor"][:] = LK_KEY_MONTH_FACTOR[prod_codes, month]
+    cols["month_factor_glob"][:] = LK_MONTH_FACTOR_GLOB[month]
+    cols["month_sin"][:] = LK_MONTH_SIN[month]
+    cols["month_cos"][:] = LK_MONTH_COS[month]
+    cols["te_marca"][:] = LK_TE_MARCA[marca_codes]
+
+    return {
+        "num": num,
+        "marca": np.asarray(marcas, dtype=object),
+        "producto": np.asarray(productos, dtype=object),
+        "fecha_mes": fechas,
+    }
+
+
+def _frame_from_columns(features: Dict[str, Any]) -> pd.DataFrame:
+    # PREPROCESS (ColumnTransformer) selecciona columnas por nombre, así que necesita un
+    # DataFrame; se arma desde columnas ya construidas, sin pasar por dicts por fila.
+    data = {c: features["num"][:, j] for j, c in enumerate(NUM_COLUMNS)}
+    data.update({c: features[c] for c in ("marca", "producto", "fecha_mes")})
+    return pd.DataFrame(data, copy=False)[XTR_RAW_COLUMNS]
+
+
 # =========================
 # Reconstrucción y predicción
 # =========================
@@ -185,19 +317,26 @@ def recon(base: np.ndarray, rhat: np.ndarray, gamma: float = GAMMA, clip: float
 
 
 def predict_batch(
-    items: List[Dict[str, Any]],
+    items: Union[List[Dict[str, Any]], Dict[str, Any]],
     baselines: List[float],
 ) -> np.ndarray:
     """
-    items: lista de filas crudas construidas con build_feature_row(...)
+    items: columnas de build_feature_columns(...) o lista de filas de build_feature_row(...)
     baselines: baseline (lag_1 o equivalente) para cada fila
     """
-    if not items:
+    if isinstance(items, dict):
+        if len(items["num"]) == 0:
+            return np.array([], dtype=float)
+        if PREPROCESS_FAST is not None:
+            Xt = PREPROCESS_FAST.transform(items)
+        else:
+            Xt = PREPROCESS.transform(_frame_from_columns(items))
+    elif not items:
         return np.array([], dtype=float)
+    else:
+        Xt = PREPROCESS.transform(pd.DataFrame(items)[XTR_RAW_COLUMNS])
 
-    df_raw = pd.DataFrame(items)[XTR_RAW_COLUMNS]
-    Xt = PREPROCESS.transform(df_raw)
-    rhat = MODEL.predict(Xt)
+    rhat = BOOSTER.inplace_predict(Xt, iteration_range=ITERATION_RANGE)
 
     y_base = np.asarray(baselines, dtype=float)
     y_pred = recon(y_base, rhat, gamma=GAMMA, clip=2.0)
@@ -222,11 +361,141 @@ def predict_one(
     if baseline is None:
         baseline = baseline_from_maps(producto, fecha_mes)
 
-    row = build_feature_row(
-        producto=producto,
-        marca=marca,
-        fecha_mes=fecha_mes,
-        pct_chg_1=pct_chg_1,
+    features = build_feature_columns(
+        productos=[producto],
+        marcas=[marca],
+        fechas_mes=[fecha_mes],
+        pct_chg_1=[pct_chg_1],
     )
-    y_pred = predict_batch([row], [baseline])[0]
-    return float(y_pred)
\ No newline at end of file
+    y_pred = predict_batch(features, [baseline])[0]
+    return float(y_pred)
+
+
+# =========================
+# Micro-batching entre requests
+# =========================
+#
+# Varias requests concurrentes de /api/forecast/xgb se juntan en un solo predict:
+# la primera abre una ventana de XGB_BATCH_MAX_WAIT_MS; todo lo que llega en ese lapso
+# (hasta XGB_BATCH_MAX_ROWS filas) se predice junto y a cada request se le devuelve su tramo.
+
+XGB_BATCH_MAX_WAIT_MS = float(os.getenv("XGB_BATCH_MAX_WAIT_MS", "2"))
+XGB_BATCH_MAX_ROWS = int(os.getenv("XGB_BATCH_MAX_ROWS", "1024"))
+
+
+def _concat_features(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if len(parts) == 1:
+        return parts[0]
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+class InferenceDispatcher:
+    """
+    Junta lotes de build_feature_columns(...) de requests concurrentes y ejecuta
+    un único predict_batch en un hilo (fuera del event loop).
+    """
+
+    def __init__(self, max_wait_ms: float = XGB_BATCH_MAX_WAIT_MS, max_rows: int = XGB_BATCH_MAX_ROWS):
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_rows = max(1, max_rows)
+        self._pending: List[tuple] = []   # (features, baselines, future)
+        self._pending_rows = 0
+        self._timer: asyncio.TimerHandle | None = None
+        # El event loop solo guarda referencias débiles a las tareas: sin este set un lote
+        # en curso podría ser recolectado y sus requests quedarían esperando para siempre
+        self._tasks: set[asyncio.Task] = set()
+        self._stats = {
+            "requests": 0,
+            "rows": 0,
+            "batches": 0,
+            "max_batch_rows": 0,
+            "max_batch_requests": 0,
+            "predict_seconds": 0.0,
+            "errors": 0,
+        }
+
+    async def predict(self, features: Dict[str, Any], baselines: Sequence[float]) -> np.ndarray:
+        n = len(features["num"])
+        if n == 0:
+            return np.array([], dtype=float)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((features, np.asarray(baselines, dtype=float), fut))
+        self._pending_rows += n
+
+        if self._pending_rows >= self.max_rows or self.max_wait == 0.0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple]) -> None:
+        sizes = [len(f["num"]) for f, _, _ in batch]
+        features = _concat_features([f for f, _, _ in batch])
+        baselines = np.concatenate([b for _, b, _ in batch])
+
+        t0 = time.perf_counter()
+        try:
+            y_pred = await asyncio.get_running_loop().run_in_executor(None, predict_batch, features, baselines)
+        except asyncio.CancelledError:
+            for _, _, fut in batch:
+                fut.cancel()
+            raise
+        except Exception as e:
+            self._stats["errors"] += 1
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._stats["predict_seconds"] += time.perf_counter() - t0
+
+        st = self._stats
+        st["requests"] += len(batch)
+        st["rows"] += len(baselines)
+        st["batches"] += 1
+        st["max_batch_rows"] = max(st["max_batch_rows"], len(baselines))
+        st["max_batch_requests"] = max(st["max_batch_requests"], len(batch))
+
+        start = 0
+        for size, (_, _, fut) in zip(sizes, batch):
+            if not fut.done():   # la request pudo cancelarse mientras esperaba
+                fut.set_result(y_pred[start:start + size])
+            start += size
+
+    async def shutdown(self) -> None:
+        """Al apagar: cancela lo que aún no se despachó y espera los lotes en curso."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, _, fut in self._pending:
+            fut.cancel()
+        self._pending, self._pending_rows = [], 0
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        st = dict(self._stats)
+        batches = st["batches"] or 1
+        st.update({
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_rows": self.max_rows,
+            "pending_rows": self._pending_rows,
+            "avg_batch_rows": st["rows"] / batches,
+            "avg_batch_requests": st["requests"] / batches,
+            "avg_predict_ms": st["predict_seconds"] * 1000.0 / batches,
+        })
+        return st
+
+
+XGB_DISPATCHER = InferenceDispatcher()
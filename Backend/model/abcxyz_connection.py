@@ -0,0 +1,119 @@
+# model/abcxyz_connection.py
+import json
+import zlib
+
+from config.database import connection
+
+# Filas del log de cambios (sql/004) a partir de las cuales se compacta al leer la versión
+ABCXYZ_CAMBIOS_COMPACTAR = 1000
+
+
+def pack_payload(payload: dict) -> bytes:
+    """Serializa un análisis ABC-XYZ: JSON compacto + zlib."""
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def unpack_payload(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class AbcxyzConnection:
+    # --------- INSERT ---------
+    async def insert_resultado(self, fuente: str, n_items: int, blob: bytes, cache_key: str | None = None) -> int:
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO abcxyz_resultado (fuente, n_items, payload, cache_key)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id_resultado
+                """,
+                (fuente, n_items, blob, cache_key),
+            )
+            return (await cur.fetchone())[0]
+
+    # --------- ÚLTIMO ---------
+    async def read_ultimo_id(self, fuente: str | None = None):
+        """
+        id_resultado del análisis más reciente (de la fuente indicada o de cualquiera).
+        Solo lee el índice; el payload se pide aparte si no está en caché.
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            if fuente is None:
+                await cur.execute(
+                    """
+                    SELECT id_resultado
+                    FROM abcxyz_resultado
+                    ORDER BY creado_en DESC, id_resultado DESC
+                    LIMIT 1
+                    """
+                )
+            else:
+                await cur.execute(
+                    """
+                    SELECT id_resultado
+                    FROM abcxyz_resultado
+                    WHERE fuente = %s
+                    ORDER BY creado_en DESC, id_resultado DESC
+                    LIMIT 1
+                    """,
+                    (fuente,),
+                )
+            row = await cur.fetchone()
+            return row[0] if row else None
+
+    # --------- CACHÉ ---------
+    async def read_data_version(self) -> int:
+        """
+        Versión de los datos de venta/producto: cambios compactados + cambios en el log
+        (los agregan triggers, ver sql/004). Se lee en una sola sentencia (una sola foto).
+        Si el log creció, lo compacta (la versión no cambia al compactar).
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT v.compactados, (SELECT COUNT(*) FROM abcxyz_cambio)
+                FROM abcxyz_version v
+                """
+            )
+            row = await cur.fetchone()
+            if not row:
+                return 0
+            compactados, pendientes = row
+            if pendientes > ABCXYZ_CAMBIOS_COMPACTAR:
+                await cur.execute("SELECT abcxyz_compactar()")
+            return compactados + pendientes
+
+    async def touch_by_cache_key(self, fuente: str, cache_key: str):
+        """
+        Busca un resultado guardado con esa clave de caché y, si existe, actualiza su creado_en
+        para que vuelva a ser el "último análisis". Devuelve id_resultado o None.
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE abcxyz_resultado
+                SET creado_en = now()
+                WHERE id_resultado = (
+                    SELECT id_resultado
+                    FROM abcxyz_resultado
+                    WHERE fuente = %s AND cache_key = %s
+                    ORDER BY id_resultado DESC
+                    LIMIT 1
+                )
+                RETURNING id_resultado
+                """,
+                (fuente, cache_key),
+            )
+            row = await cur.fetchone()
+            return row[0] if row else None
+
+    # --------- PAYLOAD ---------
+    async def read_payload(self, id_resultado: int):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "SELECT payload FROM abcxyz_resultado WHERE id_resultado = %s",
+                (id_resultado,),
+            )
+            row = await cur.fetchone()
+            return bytes(row[0]) if row else None
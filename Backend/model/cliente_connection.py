@@ -1,40 +1,28 @@
 # model/cliente_connection.py
-import psycopg
-import os
+from config.database import connection
 
 class ClienteConnection:
-    conn = None
-
-    def __init__(self):
-        try:
-            # Mantiene la conexión segura de Render usando la variable de entorno
-            self.conn = psycopg.connect(os.getenv("DATABASE_URL"))
-            print("✅ Conectado a PostgreSQL en Render (Producción)")
-        except Exception as err:
-            print(f"❌ Error conectando a la base de datos: {err}")
-
     # C
-    def insert_cliente(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def insert_cliente(self, data):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 INSERT INTO cliente (nombre_empresa, ruc, direccion)
                 VALUES (%(nombre_empresa)s, %(ruc)s, %(direccion)s)
                 """,
                 data,
             )
-            self.conn.commit()
 
     # R (listar) - ACTUALIZADO: Ahora ordena por los más recientes primero (DESC)
-    def read_cliente(self):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT id_cliente, nombre_empresa, ruc, direccion FROM cliente ORDER BY id_cliente DESC")
-            return cur.fetchall()
+    async def read_cliente(self):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT id_cliente, nombre_empresa, ruc, direccion FROM cliente ORDER BY id_cliente DESC")
+            return await cur.fetchall()
 
     # R (ruc ÚNICO) - NUEVO: Agregado desde tu versión local
-    def get_by_ruc(self, ruc: str):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def get_by_ruc(self, ruc: str):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id_cliente, nombre_empresa, ruc, direccion
                 FROM cliente
@@ -42,27 +30,26 @@ class ClienteConnection:
                 """,
                 (ruc,)
             )
-            return cur.fetchone()
+            return await cur.fetchone()
 
     # R (uno)
-    def filtrar_cliente(self, id_cliente):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def filtrar_cliente(self, id_cliente):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 "SELECT id_cliente, nombre_empresa, ruc, direccion FROM cliente WHERE id_cliente = %s",
                 (id_cliente,),
             )
-            return cur.fetchone()
+            return await cur.fetchone()
 
     # D
-    def delete_cliente(self, id_cliente):
-        with self.conn.cursor() as cur:
-            cur.execute("DELETE FROM cliente WHERE id_cliente = %s", (id_cliente,))
-            self.conn.commit()
+    async def delete_cliente(self, id_cliente):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute("DELETE FROM cliente WHERE id_cliente = %s", (id_cliente,))
 
     # U
-    def update_cliente(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def update_cliente(self, data):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE cliente
                 SET nombre_empresa = %(nombre_empresa)s,
@@ -72,11 +59,3 @@ class ClienteConnection:
                 """,
                 data,
             )
-            self.conn.commit()
-
-    def __del__(self):
-        if getattr(self, "conn", None):
-            try:
-                self.conn.close()
-            except Exception:
-                pass
\ No newline at end of file
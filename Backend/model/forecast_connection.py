@@ -1,146 +1,200 @@
 # model/forecast_connection.py
-import psycopg
-import os
+from config.database import connection
+
+# Columnas de forecast_detalle que se cargan por COPY (en este orden)
+_DETALLE_COLS = (
+    "id_producto", "fecha_mes", "venta_predicha", "baseline",
+    "categoria_abc", "categoria_xyz", "categoria_abcxyz",
+)
 
 class ForecastConnection:
-    conn = None
-    def __init__(self):
-        try:
-            self.conn = psycopg.connect(os.getenv("DATABASE_URL"))
-            print("✅ Conectado a PostgreSQL en Render (desde local)")
-        except Exception as err:
-            print(f"❌ Error conectando a la base de datos: {err}")
-    # --------- INSERT CABECERA ---------
-    def insert_run(self, data):
+    # --------- helpers ---------
+    async def _insert_run(self, cur, data) -> int:
+        await cur.execute(
+            """
+            INSERT INTO forecast_run
+                (id_usuario, origen, modelo, modelo_version,
+                 periodo_inicio, periodo_fin, horizonte_meses)
+            VALUES
+                (%(id_usuario)s, %(origen)s, %(modelo)s, %(modelo_version)s,
+                 %(periodo_inicio)s, %(periodo_fin)s, %(horizonte_meses)s)
+            RETURNING id_run
+            """,
+            data,
+        )
+        return (await cur.fetchone())[0]
+
+    async def _copy_detalle(self, cur, id_run: int, detalles) -> None:
         """
-        Inserta una corrida en forecast_run y devuelve id_run.
-        Hace rollback si algo falla para no dejar la transacción en estado abortado.
+        Carga las filas de detalle de id_run con COPY ... FROM STDIN
+        (un solo flujo, sin un INSERT por fila).
         """
-        if not self.conn:
-            raise RuntimeError("No hay conexión a la BD (forecast_run).")
+        async with cur.copy(
+            f"COPY forecast_detalle (id_run, {', '.join(_DETALLE_COLS)}) FROM STDIN"
+        ) as copy:
+            for d in detalles:
+                await copy.write_row((id_run, *(d[c] for c in _DETALLE_COLS)))
 
+    # --------- INSERT CORRIDA COMPLETA ---------
+    async def insert_run_con_detalle(self, data, detalles) -> int:
+        """
+        Inserta la cabecera y su detalle (sin id_run; se completa acá) en UNA transacción:
+        si falla el COPY, no queda una corrida vacía a medio guardar. Devuelve id_run.
+        """
         try:
-            with self.conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO forecast_run
-                        (id_usuario, origen, modelo, modelo_version,
-                         periodo_inicio, periodo_fin, horizonte_meses)
-                    VALUES
-                        (%(id_usuario)s, %(origen)s, %(modelo)s, %(modelo_version)s,
-                         %(periodo_inicio)s, %(periodo_fin)s, %(horizonte_meses)s)
-                    RETURNING id_run
-                    """,
-                    data,
-                )
-                id_run = cur.fetchone()[0]
-            self.conn.commit()
+            async with connection() as conn, conn.cursor() as cur:
+                id_run = await self._insert_run(cur, data)
+                if detalles:
+                    await self._copy_detalle(cur, id_run, detalles)
             return id_run
         except Exception as e:
-            # súper importante: limpiar la transacción
-            self.conn.rollback()
-            print("Error insert_run:", e)
+            print("Error insert_run_con_detalle:", e)
             raise
 
-    # --------- INSERT DETALLE (MANY) ---------
-    def insert_detalle_many(self, detalles):
+    # --------- SELECT CABECERAS (paginado) ---------
+    async def read_runs_page(self, limit: int, after=None, origen: str | None = None):
         """
-        Inserta muchas filas en forecast_detalle.
+        Corridas por keyset (id_run DESC), con la cantidad de filas y el total predicho
+        de cada una calculados en SQL. after = id_run de la última fila de la página anterior.
         """
-        if not detalles:
-            return
-        if not self.conn:
-            raise RuntimeError("No hay conexión a la BD (forecast_detalle).")
-
-        try:
-            with self.conn.cursor() as cur:
-                cur.executemany(
-                    """
-                    INSERT INTO forecast_detalle
-                        (id_run, id_producto, fecha_mes,
-                         venta_predicha, baseline,
-                         categoria_abc, categoria_xyz, categoria_abcxyz)
-                    VALUES
-                        (%(id_run)s, %(id_producto)s, %(fecha_mes)s,
-                         %(venta_predicha)s, %(baseline)s,
-                         %(categoria_abc)s, %(categoria_xyz)s, %(categoria_abcxyz)s)
-                    """,
-                    detalles,
-                )
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            print("Error insert_detalle_many:", e)
-            raise
+        conds, params = [], {"limit": limit}
+        if origen is not None:
+            conds.append("r.origen = %(origen)s")
+            params["origen"] = origen
+        if after is not None:
+            conds.append("r.id_run < %(after)s")
+            params["after"] = after
+        where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT r.id_run,
+                       r.creado_en,
+                       r.origen,
+                       r.modelo,
+                       r.modelo_version,
+                       r.periodo_inicio,
+                       r.periodo_fin,
+                       r.horizonte_meses,
+                       s.items,
+                       s.total_predicho
+                FROM forecast_run r
+                LEFT JOIN LATERAL (
+                    SELECT COUNT(*) AS items,
+                           COALESCE(SUM(d.venta_predicha), 0)::float AS total_predicho
+                    FROM forecast_detalle d
+                    WHERE d.id_run = r.id_run
+                ) s ON true
+                {where}
+                ORDER BY r.id_run DESC
+                LIMIT %(limit)s
+                """,
+                params,
+            )
+            return await cur.fetchall()
 
-    # --------- SELECT CABECERAS ---------
-    def read_runs(self):
-        if not self.conn:
-            return []
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id_run,
-                       creado_en,
-                       origen,
-                       modelo,
-                       modelo_version,
-                       periodo_inicio,
-                       periodo_fin,
-                       horizonte_meses
-                FROM forecast_run
-                ORDER BY id_run DESC
+    # --------- RESUMEN POR RUN ---------
+    async def read_run_resumen(self, id_run: int):
+        """
+        Totales de una corrida calculados en SQL: una fila por categoría ABC-XYZ y una fila
+        de total general (es_total = true). Columnas:
+        (categoria_abcxyz, es_total, items, productos, total_predicho, total_baseline).
+        Devuelve None si la corrida no existe.
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT 1 FROM forecast_run WHERE id_run = %s", (id_run,))
+            if await cur.fetchone() is None:
+                return None
+            await cur.execute(
                 """
+                SELECT categoria_abcxyz,
+                       GROUPING(categoria_abcxyz) = 1 AS es_total,
+                       COUNT(*),
+                       COUNT(DISTINCT id_producto),
+                       COALESCE(SUM(venta_predicha), 0)::float,
+                       COALESCE(SUM(baseline), 0)::float
+                FROM forecast_detalle
+                WHERE id_run = %s
+                GROUP BY GROUPING SETS ((categoria_abcxyz), ())
+                ORDER BY es_total DESC, categoria_abcxyz NULLS LAST
+                """,
+                (id_run,),
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
-    # --------- SELECT DETALLE POR RUN ---------
-    def read_detalle_by_run(self, id_run: int):
-        if not self.conn:
-            return []
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
+    # --------- SELECT DETALLE POR RUN (paginado) ---------
+    async def read_detalle_page(
+        self,
+        id_run: int,
+        limit: int,
+        after=None,
+        id_producto: int | None = None,
+        categoria_abcxyz: str | None = None,
+    ):
+        """
+        Detalle de una corrida en el mismo orden de siempre (mes y nombre de producto, los
+        productos borrados al final), paginado por keyset sobre ese orden más id_detalle.
+        Opcionalmente filtrado por producto y/o categoría.
+        after = (fecha_mes, nombre_producto, id_detalle) de la última fila anterior.
+
+        El nombre sale del JOIN con producto, así que ningún índice cubre el orden: el índice
+        por id_run acota la corrida y PostgreSQL ordena solo esas filas (catálogo x horizonte).
+        """
+        conds, params = ["d.id_run = %(id_run)s"], {"id_run": id_run, "limit": limit}
+        if id_producto is not None:
+            conds.append("d.id_producto = %(id_producto)s")
+            params["id_producto"] = id_producto
+        if categoria_abcxyz is not None:
+            conds.append("d.categoria_abcxyz = %(categoria_abcxyz)s")
+            params["categoria_abcxyz"] = categoria_abcxyz
+        if after is not None:
+            # NULL no se puede comparar en un ROW(): el orden usa (nombre IS NULL, COALESCE(nombre, ''))
+            conds.append(
+                "(d.fecha_mes, p.nombre_producto IS NULL, COALESCE(p.nombre_producto, ''), d.id_detalle)"
+                " > (%(after_fecha)s, %(after_nulo)s, %(after_nombre)s, %(after_id)s)"
+            )
+            after_fecha, after_nombre, after_id = after
+            params.update(
+                after_fecha=after_fecha,
+                after_nulo=after_nombre is None,
+                after_nombre=after_nombre or "",
+                after_id=after_id,
+            )
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                f"""
                 SELECT d.id_detalle,
                        d.id_run,
                        d.id_producto,
                        p.nombre_producto,
                        d.fecha_mes,
-                       d.venta_predicha,
-                       d.baseline,
+                       d.venta_predicha::float,
+                       d.baseline::float,
                        d.categoria_abc,
                        d.categoria_xyz,
                        d.categoria_abcxyz
                 FROM forecast_detalle d
                 LEFT JOIN producto p ON p.id_producto = d.id_producto
-                WHERE d.id_run = %s
-                ORDER BY d.fecha_mes, p.nombre_producto
+                WHERE {" AND ".join(conds)}
+                ORDER BY d.fecha_mes,
+                         p.nombre_producto IS NULL,
+                         COALESCE(p.nombre_producto, ''),
+                         d.id_detalle
+                LIMIT %(limit)s
                 """,
-                (id_run,),
+                params,
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
     # --------- DELETE RUN COMPLETO ---------
-    def delete_run(self, id_run: int):
+    async def delete_run(self, id_run: int):
         """
         Elimina forecast_detalle + forecast_run para un id_run.
         """
-        if not self.conn:
-            raise RuntimeError("No hay conexión a la BD (delete_run).")
-
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("DELETE FROM forecast_detalle WHERE id_run = %s", (id_run,))
-                cur.execute("DELETE FROM forecast_run WHERE id_run = %s", (id_run,))
-            self.conn.commit()
+            async with connection() as conn, conn.cursor() as cur:
+                await cur.execute("DELETE FROM forecast_detalle WHERE id_run = %s", (id_run,))
+                await cur.execute("DELETE FROM forecast_run WHERE id_run = %s", (id_run,))
         except Exception as e:
-            self.conn.rollback()
             print("Error delete_run:", e)
             raise
-
-    def __del__(self):
-        if getattr(self, "conn", None):
-            try:
-                self.conn.close()
-            except Exception:
-                pass
@@ -0,0 +1,144 @@
+# model/job_connection.py
+from psycopg.types.json import Jsonb
+
+from config.database import connection
+
+_COLUMNAS = """
+    id_job, tipo, estado, parametros, progreso, mensaje, resultado, error,
+    intentos, creado_en, iniciado_en, actualizado_en, terminado_en
+"""
+
+class JobConnection:
+    # --------- ENCOLAR ---------
+    async def insert_job(self, tipo: str, parametros: dict) -> int:
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO job (tipo, parametros)
+                VALUES (%s, %s)
+                RETURNING id_job
+                """,
+                (tipo, Jsonb(parametros)),
+            )
+            return (await cur.fetchone())[0]
+
+    # --------- TOMAR EL SIGUIENTE ---------
+    async def claim_next(self, stale_seconds: float, max_intentos: int):
+        """
+        Toma el trabajo pendiente más antiguo (o uno 'en_curso' sin latidos hace más de
+        stale_seconds: su worker se cayó) y lo marca en curso. SKIP LOCKED evita que dos
+        workers tomen el mismo. Un abandonado que ya usó max_intentos se marca 'error'
+        en vez de reintentarse. Devuelve (id_job, tipo, parametros, intentos) o None.
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE job
+                SET estado = 'error',
+                    error = 'Se agotaron los intentos (' || intentos || ')',
+                    actualizado_en = now(),
+                    terminado_en = now()
+                WHERE estado = 'en_curso'
+                  AND actualizado_en < now() - make_interval(secs => %s)
+                  AND intentos >= %s
+                """,
+                (stale_seconds, max_intentos),
+            )
+            await cur.execute(
+                """
+                UPDATE job
+                SET estado = 'en_curso',
+                    progreso = 0,
+                    intentos = intentos + 1,
+                    iniciado_en = now(),
+                    actualizado_en = now()
+                WHERE id_job = (
+                    SELECT id_job
+                    FROM job
+                    WHERE estado = 'pendiente'
+                       OR (estado = 'en_curso'
+                           AND actualizado_en < now() - make_interval(secs => %s)
+                           AND intentos < %s)
+                    ORDER BY id_job
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id_job, tipo, parametros, intentos
+                """,
+                (stale_seconds, max_intentos),
+            )
+            return await cur.fetchone()
+
+    # --------- AVANCE / FIN ---------
+    # Todas las escrituras del worker filtran por (id_job, intentos, 'en_curso'): si el
+    # trabajo se reclamó de nuevo (intentos cambió) el worker anterior ya no lo toca.
+    # Devuelven False cuando el trabajo ya no le pertenece.
+    async def touch(self, id_job: int, intentos: int) -> bool:
+        """Latido: marca que el trabajo sigue vivo aunque no informe avance."""
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE job
+                SET actualizado_en = now()
+                WHERE id_job = %s AND intentos = %s AND estado = 'en_curso'
+                """,
+                (id_job, intentos),
+            )
+            return cur.rowcount > 0
+
+    async def update_progreso(
+        self, id_job: int, intentos: int, progreso: float, mensaje: str | None = None
+    ) -> bool:
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE job
+                SET progreso = %s,
+                    mensaje = COALESCE(%s, mensaje),
+                    actualizado_en = now()
+                WHERE id_job = %s AND intentos = %s AND estado = 'en_curso'
+                """,
+                (progreso, mensaje, id_job, intentos),
+            )
+            return cur.rowcount > 0
+
+    async def finish_ok(self, id_job: int, intentos: int, resultado: dict) -> bool:
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE job
+                SET estado = 'ok',
+                    progreso = 1,
+                    resultado = %s,
+                    error = NULL,
+                    actualizado_en = now(),
+                    terminado_en = now()
+                WHERE id_job = %s AND intentos = %s AND estado = 'en_curso'
+                """,
+                (Jsonb(resultado), id_job, intentos),
+            )
+            return cur.rowcount > 0
+
+    async def finish_error(self, id_job: int, intentos: int, error: str) -> bool:
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE job
+                SET estado = 'error',
+                    error = %s,
+                    actualizado_en = now(),
+                    terminado_en = now()
+                WHERE id_job = %s AND intentos = %s AND estado = 'en_curso'
+                """,
+                (error, id_job, intentos),
+            )
+            return cur.rowcount > 0
+
+    # --------- CONSULTA ---------
+    async def read_job(self, id_job: int):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT {_COLUMNAS} FROM job WHERE id_job = %s",
+                (id_job,),
+            )
+            return await cur.fetchone()
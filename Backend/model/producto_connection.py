@@ -1,22 +1,11 @@
 # model/producto_connection.py
-import psycopg
-import os
+from config.database import connection
 
 class ProductoConnection:
-    conn = None
-
-    def __init__(self):
-        try:
-            # Mantiene la conexión segura de producción en Render
-            self.conn = psycopg.connect(os.getenv("DATABASE_URL"))
-            print("✅ Conectado a PostgreSQL en Render (Producción)")
-        except Exception as err:
-            print(f"❌ Error conectando a la base de datos: {err}")
-
     # CREATE
-    def insert_producto(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def insert_producto(self, data):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 INSERT INTO producto (nombre_producto, id_marca, precio_unitario, stock)
                 VALUES (%(nombre_producto)s, %(id_marca)s, %(precio_unitario)s, %(stock)s)
@@ -24,14 +13,13 @@ class ProductoConnection:
                 """,
                 data
             )
-            new_id = cur.fetchone()[0]
-            self.conn.commit()
+            new_id = (await cur.fetchone())[0]
             return new_id
 
     # READ (lista simple) - ACTUALIZADO: Ordenamiento DESC según tu local
-    def read_producto(self):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def read_producto(self):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   p.id_producto,
@@ -45,12 +33,12 @@ class ProductoConnection:
                 ORDER BY p.id_producto DESC
                 """
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
     # READ (lista con nombre de marca) - ACTUALIZADO: Ordenamiento DESC según tu local
-    def read_producto_view(self):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def read_producto_view(self):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   p.id_producto,
@@ -66,12 +54,29 @@ class ProductoConnection:
                 ORDER BY p.id_producto DESC
                 """
             )
-            return cur.fetchall()
+            return await cur.fetchall()
+
+    # READ (id, nombre, marca) para el forecast; ids=None -> todo el catálogo
+    async def read_producto_marca(self, ids=None):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT p.id_producto,
+                       p.nombre_producto,
+                       COALESCE(m.nombre_marca, '') AS nombre_marca
+                FROM producto p
+                LEFT JOIN marca m ON m.id_marca = p.id_marca
+                WHERE %(ids)s::int[] IS NULL OR p.id_producto = ANY(%(ids)s::int[])
+                ORDER BY p.id_producto
+                """,
+                {"ids": ids},
+            )
+            return await cur.fetchall()
 
     # READ uno
-    def filtrar_producto(self, id_producto):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def filtrar_producto(self, id_producto):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   p.id_producto,
@@ -85,18 +90,17 @@ class ProductoConnection:
                 """,
                 (id_producto,)
             )
-            return cur.fetchone()
+            return await cur.fetchone()
 
     # DELETE
-    def delete_producto(self, id_producto):
-        with self.conn.cursor() as cur:
-            cur.execute("DELETE FROM producto WHERE id_producto = %s", (id_producto,))
-            self.conn.commit()
+    async def delete_producto(self, id_producto):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute("DELETE FROM producto WHERE id_producto = %s", (id_producto,))
 
     # UPDATE
-    def update_producto(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def update_producto(self, data):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE producto
                 SET nombre_producto = %(nombre_producto)s,
@@ -107,11 +111,3 @@ class ProductoConnection:
                 """,
                 data
             )
-            self.conn.commit()
-
-    def __del__(self):
-        if getattr(self, "conn", None):
-            try:
-                self.conn.close()
-            except Exception:
-                pass
\ No newline at end of file
@@ -1,44 +1,32 @@
 # model/tipo_usuario_connection.py
-import psycopg
-import os
+from config.database import connection
 
 class TipoUsuarioConnection:
-    conn = None
-
-    def __init__(self):
-        try:
-            # Mantiene la conexión segura de producción en Render
-            self.conn = psycopg.connect(os.getenv("DATABASE_URL"))
-            print("✅ Conectado a PostgreSQL en Render (Producción)")
-        except Exception as err:
-            print(f"❌ Error conectando a la base de datos: {err}")
-
-    def insert_tipo_usuario(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def insert_tipo_usuario(self, data):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 INSERT INTO tipo_usuario (tipo_usuario, id_usuario)
                 VALUES (%(tipo_usuario)s, %(id_usuario)s)
                 """,
                 data,
             )
-            self.conn.commit()
 
     # READ - ACTUALIZADO: Ahora ordena de forma descendente (DESC) según tu local
-    def read_tipo_usuario(self):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def read_tipo_usuario(self):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id_tipousuario, tipo_usuario, id_usuario
                 FROM tipo_usuario
                 ORDER BY id_tipousuario DESC
                 """
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
-    def filtrar_tipo_usuario(self, id_tipousuario):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def filtrar_tipo_usuario(self, id_tipousuario):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id_tipousuario, tipo_usuario, id_usuario
                 FROM tipo_usuario
@@ -46,11 +34,11 @@ class TipoUsuarioConnection:
                 """,
                 (id_tipousuario,),
             )
-            return cur.fetchone()
+            return await cur.fetchone()
 
-    def listar_por_usuario(self, id_usuario):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def listar_por_usuario(self, id_usuario):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id_tipousuario, tipo_usuario, id_usuario
                 FROM tipo_usuario
@@ -59,19 +47,18 @@ class TipoUsuarioConnection:
                 """,
                 (id_usuario,),
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
-    def delete_tipo_usuario(self, id_tipousuario):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def delete_tipo_usuario(self, id_tipousuario):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 "DELETE FROM tipo_usuario WHERE id_tipousuario = %s",
                 (id_tipousuario,),
             )
-            self.conn.commit()
 
-    def update_tipo_usuario(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def update_tipo_usuario(self, data):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE tipo_usuario
                    SET tipo_usuario = %(tipo_usuario)s,
@@ -80,11 +67,3 @@ class TipoUsuarioConnection:
                 """,
                 data,
             )
-            self.conn.commit()
-
-    def __del__(self):
-        if getattr(self, "conn", None):
-            try:
-                self.conn.close()
-            except Exception:
-                pass
\ No newline at end of file
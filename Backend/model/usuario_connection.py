@@ -1,101 +1,132 @@
 # model/usuario_connection.py
-import psycopg
-import os
+from psycopg import errors
 
-class UsuarioConnection():
-    conn = None
+from config.database import connection
 
-    def __init__(self):
-        try:
-            # Mantiene la conexión segura de producción en Render
-            self.conn = psycopg.connect(os.getenv("DATABASE_URL"))
-            print("✅ Conectado a PostgreSQL en Render (Producción)")
-        except Exception as err:
-            print(f"❌ Error conectando a la base de datos: {err}")
+# Índices únicos de sql/008_usuario_unico.sql -> campo duplicado
+_UNICOS = {
+    "uq_usuario_lower_usuario": "usuario",
+    "uq_usuario_lower_correo": "correo",
+}
 
-    def insert_usuario(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO usuario (usuario, nombre, apellido, correo, contrasenia)
-                VALUES (%(usuario)s, %(nombre)s, %(apellido)s, %(correo)s, %(contrasenia)s)
-                """, data
-            )
-            self.conn.commit()
+class UsuarioDuplicado(Exception):
+    """El usuario o el correo ya existen (campo = 'usuario' | 'correo')."""
+    def __init__(self, campo: str):
+        super().__init__(campo)
+        self.campo = campo
+
+def _duplicado(e: errors.UniqueViolation) -> UsuarioDuplicado:
+    return UsuarioDuplicado(_UNICOS.get(e.diag.constraint_name, "usuario"))
+
+class UsuarioConnection():
+    async def registrar_usuario(self, data, rol: str) -> int:
+        """
+        Alta de usuario + su rol en UNA transacción (si falla el rol, no queda el usuario).
+        Los duplicados los detectan los índices únicos: lanza UsuarioDuplicado.
+        Devuelve el id nuevo.
+        """
+        try:
+            async with connection() as conn, conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    INSERT INTO usuario (usuario, nombre, apellido, correo, contrasenia)
+                    VALUES (%(usuario)s, %(nombre)s, %(apellido)s, %(correo)s, %(contrasenia)s)
+                    RETURNING id
+                    """, data
+                )
+                nuevo_id = (await cur.fetchone())[0]
+                await cur.execute(
+                    """
+                    INSERT INTO tipo_usuario (tipo_usuario, id_usuario)
+                    VALUES (%s, %s)
+                    """, (rol, nuevo_id)
+                )
+            return nuevo_id
+        except errors.UniqueViolation as e:
+            raise _duplicado(e)
 
     # READ - ACTUALIZADO: Ahora ordena de forma descendente (DESC) según tu local
-    def read_usuario(self):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def read_usuario(self):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id, usuario, nombre, apellido, correo, contrasenia 
                 FROM usuario
                 ORDER BY id DESC
                 """
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
-    def filtrar_usuario(self, id):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def filtrar_usuario(self, id):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id, usuario, nombre, apellido, correo, contrasenia 
                 FROM usuario WHERE id = %s
                 """, (id,)
             )
-            return cur.fetchone()
+            return await cur.fetchone()
 
-    def delete_usuario(self, id):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def delete_usuario(self, id):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 DELETE FROM usuario WHERE id = %s
                 """, (id,)
-            )
-            self.conn.commit()        
+            )        
     
-    def update_usuario(self, data):
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE usuario
-                SET usuario = %(usuario)s,
-                    nombre = %(nombre)s,
-                    apellido = %(apellido)s,
-                    correo = %(correo)s,
-                    contrasenia = %(contrasenia)s
-                WHERE id = %(id)s
-                """, data
-            )
-            self.conn.commit()
+    async def update_usuario(self, data):
+        try:
+            async with connection() as conn, conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    UPDATE usuario
+                    SET usuario = %(usuario)s,
+                        nombre = %(nombre)s,
+                        apellido = %(apellido)s,
+                        correo = %(correo)s,
+                        contrasenia = %(contrasenia)s
+                    WHERE id = %(id)s
+                    """, data
+                )
+        except errors.UniqueViolation as e:
+            raise _duplicado(e)
 
-    # R (usuario ÚNICO) - ACTUALIZADO: Ahora usa LOWER para evitar duplicados por mayúsculas
-    def get_by_usuario(self, usuario: str):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def update_contrasenia(self, id, nueva: str, anterior: str) -> bool:
+        """
+        Reemplaza la contraseña guardada (re-hash / migración desde texto plano).
+        Solo si nadie la cambió mientras tanto. Devuelve True si se actualizó.
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
-                SELECT id, usuario, nombre, apellido, correo, contrasenia
-                FROM usuario
-                WHERE LOWER(usuario) = LOWER(%s)
-                """, (usuario,)
+                UPDATE usuario SET contrasenia = %s
+                WHERE id = %s AND contrasenia = %s
+                """, (nueva, id, anterior)
             )
-            return cur.fetchone()
+            return cur.rowcount == 1
 
-    # R (correo ÚNICO) - NUEVO: Agregado desde tu versión local para validación de registros
-    def get_by_correo(self, correo: str):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    # LOGIN: usuario + roles en una sola consulta (índice sobre LOWER(usuario), sql/007 y 008)
+    async def get_login(self, usuario: str):
+        """
+        (id, usuario, nombre, apellido, correo, contrasenia, roles) con roles = array de
+        tipo_usuario.tipo_usuario ordenado por id_tipousuario (vacío si no tiene).
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
-                SELECT id, usuario, nombre, apellido, correo, contrasenia
-                FROM usuario
-                WHERE LOWER(correo) = LOWER(%s)
-                """, (correo,)
+                SELECT u.id, u.usuario, u.nombre, u.apellido, u.correo, u.contrasenia,
+                       COALESCE(
+                           array_agg(t.tipo_usuario ORDER BY t.id_tipousuario)
+                               FILTER (WHERE t.id_tipousuario IS NOT NULL),
+                           '{}'
+                       )
+                FROM usuario u
+                LEFT JOIN tipo_usuario t ON t.id_usuario = u.id
+                WHERE LOWER(u.usuario) = LOWER(%s)
+                GROUP BY u.id
+                ORDER BY u.id
+                LIMIT 1
+                """, (usuario,)
             )
-            return cur.fetchone()
-
-    def __del__(self):
-        if getattr(self, "conn", None):
-            try:
-                self.conn.close()
-            except Exception:
-                pass
\ No newline at end of file
+            return await cur.fetchone()
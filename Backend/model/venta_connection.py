@@ -1,45 +1,67 @@
 # model/venta_connection.py
-import psycopg
-import os
 from decimal import Decimal
 
-class VentaConnection:
-    conn = None
+from config.database import connection
 
-    def __init__(self):
-        try:
-            # Mantiene la conexión segura de producción en Render usando variables de entorno
-            self.conn = psycopg.connect(os.getenv("DATABASE_URL"))
-            print("✅ Conectado a PostgreSQL en Render (Producción)")
-        except Exception as err:
-            print(f"❌ Error conectando a la base de datos: {err}")
+def _orden_fecha(p: str = "") -> str:
+    """
+    Clave de orden de los listados: fecha con las ventas sin fecha al final (NULLS LAST en DESC).
+    Con COALESCE el keyset es una comparación de filas simple que usan los índices de sql/001.
+    """
+    return f"COALESCE({p}fecha, '-infinity'::date)"
 
+class VentaConnection:
     # ----------------- helpers -----------------
-    def _calc_importe(self, id_producto: int, cantidad: int) -> Decimal:
+    async def _calc_importe(self, cur, id_producto: int, cantidad: int) -> Decimal:
         """
         Obtiene el precio del producto y calcula el importe = precio * cantidad.
         Se castea a numeric para evitar problemas si usas MONEY en la DB.
+        Usa el cursor de la operación para no pedir otra conexión al pool.
+        """
+        await cur.execute(
+            "SELECT precio_unitario::numeric FROM producto WHERE id_producto = %s",
+            (id_producto,),
+        )
+        row = await cur.fetchone()
+        if not row:
+            raise ValueError("Producto no encontrado")
+        precio = Decimal(str(row[0]))
+        return (precio * Decimal(cantidad)).quantize(Decimal("0.01"))
+
+    def _where_listado(self, filtros: dict, after=None, alias: str = "") -> tuple[str, dict]:
+        """
+        Arma el WHERE de los listados paginados.
+        filtros = { fecha_desde, fecha_hasta, id_producto, id_cliente, estado } (todos opcionales)
+        after   = (fecha, id_venta) de la última fila de la página anterior (keyset; fecha puede ser None)
         """
-        with self.conn.cursor() as cur:
-            cur.execute(
-                "SELECT precio_unitario::numeric FROM producto WHERE id_producto = %s",
-                (id_producto,),
+        p = f"{alias}." if alias else ""
+        conds, params = [], {}
+        if filtros.get("fecha_desde") is not None:
+            conds.append(f"{p}fecha >= %(fecha_desde)s")
+        if filtros.get("fecha_hasta") is not None:
+            conds.append(f"{p}fecha <= %(fecha_hasta)s")
+        for col in ("id_producto", "id_cliente", "estado"):
+            if filtros.get(col) is not None:
+                conds.append(f"{p}{col} = %({col})s")
+        params.update({k: v for k, v in filtros.items() if v is not None})
+        if after is not None:
+            # (orden, id_venta) < cursor  <=>  siguiente fila en ORDER BY orden DESC, id_venta DESC
+            conds.append(
+                f"({_orden_fecha(p)}, {p}id_venta)"
+                " < (COALESCE(%(after_fecha)s::date, '-infinity'::date), %(after_id)s)"
             )
-            row = cur.fetchone()
-            if not row:
-                raise ValueError("Producto no encontrado")
-            precio = Decimal(str(row[0]))
-            return (precio * Decimal(cantidad)).quantize(Decimal("0.01"))
+            params["after_fecha"], params["after_id"] = after
+        where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        return where, params
 
     # ----------------- CRUD -----------------
-    def insert_venta(self, data: dict):
+    async def insert_venta(self, data: dict):
         """
         data = { id_producto, id_cliente, fecha(opc), cantidad, estado(opc) }
         """
-        importe = self._calc_importe(data["id_producto"], data["cantidad"])
-
-        with self.conn.cursor() as cur:
-            cur.execute(
+        async with connection() as conn, conn.cursor() as cur:
+            importe = await self._calc_importe(cur, data["id_producto"], data["cantidad"])
+            await cur.execute(
                 """
                 INSERT INTO venta (id_producto, id_cliente, fecha, cantidad, importe_total, estado)
                 VALUES (%(id_producto)s, %(id_cliente)s, COALESCE(%(fecha)s, CURRENT_DATE),
@@ -50,24 +72,27 @@ class VentaConnection:
                     "importe_total": importe,
                 },
             )
-            self.conn.commit()
 
-    # lista - ACTUALIZADO: Ahora ordena por fecha y ID descendente según tu versión local
-    def read_venta(self):
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
+    # lista paginada por keyset (fecha DESC, id_venta DESC) con filtros
+    async def read_venta_page(self, limit: int, after=None, **filtros):
+        where, params = self._where_listado(filtros, after)
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                f"""
                 SELECT id_venta, id_producto, id_cliente, fecha,
                        cantidad, importe_total, estado
                 FROM venta
-                ORDER BY fecha DESC, id_venta DESC
-                """
+                {where}
+                ORDER BY {_orden_fecha()} DESC, id_venta DESC
+                LIMIT %(limit)s
+                """,
+                {**params, "limit": limit},
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
-    def filtrar_venta(self, id_venta: int):
-        with self.conn.cursor() as cur:
-            cur.execute(
+    async def filtrar_venta(self, id_venta: int):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id_venta, id_producto, id_cliente, fecha,
                        cantidad, importe_total, estado
@@ -76,22 +101,20 @@ class VentaConnection:
                 """,
                 (id_venta,),
             )
-            return cur.fetchone()
+            return await cur.fetchone()
 
-    def delete_venta(self, id_venta: int):
-        with self.conn.cursor() as cur:
-            cur.execute("DELETE FROM venta WHERE id_venta = %s", (id_venta,))
-            self.conn.commit()
+    async def delete_venta(self, id_venta: int):
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute("DELETE FROM venta WHERE id_venta = %s", (id_venta,))
 
-    def update_venta(self, data: dict):
+    async def update_venta(self, data: dict):
         """
         data = { id_venta, id_producto, id_cliente, fecha(opc), cantidad, estado(opc) }
         Siempre recalculamos el importe con los valores actuales.
         """
-        importe = self._calc_importe(data["id_producto"], data["cantidad"])
-
-        with self.conn.cursor() as cur:
-            cur.execute(
+        async with connection() as conn, conn.cursor() as cur:
+            importe = await self._calc_importe(cur, data["id_producto"], data["cantidad"])
+            await cur.execute(
                 """
                 UPDATE venta
                 SET id_producto  = %(id_producto)s,
@@ -107,16 +130,144 @@ class VentaConnection:
                     "importe_total": importe,
                 },
             )
-            self.conn.commit()
 
-    # ----------------- DASHBOARD -----------------
-    def read_venta_view(self):
+    # ----------------- CARGA MASIVA -----------------
+    async def importar_ventas(self, rows, parcial: bool = False, solo_validar: bool = False):
         """
-        Devuelve ventas con nombres de cliente y producto.
+        Carga masiva en UNA transacción:
+          1) COPY de rows = [(linea, id_producto, id_cliente, fecha, cantidad, estado), ...]
+             a una tabla temporal de staging,
+          2) validación por conjuntos (producto y cliente existentes),
+          3) INSERT ... SELECT en venta con importe_total = precio_unitario * cantidad
+             (un solo JOIN con producto, sin un SELECT de precio por fila).
+        Si hay filas inválidas solo se inserta con parcial=True (las válidas);
+        con solo_validar=True nunca se inserta. Los triggers mantienen venta_mensual.
+        Devuelve (insertadas, errores) con errores = [(linea, motivo), ...].
         """
-        with self.conn.cursor() as cur:
-            cur.execute(
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                CREATE TEMP TABLE venta_staging (
+                    linea       integer NOT NULL,
+                    id_producto integer NOT NULL,
+                    id_cliente  integer NOT NULL,
+                    fecha       date,
+                    cantidad    integer NOT NULL,
+                    estado      integer
+                ) ON COMMIT DROP
+                """
+            )
+            async with cur.copy(
+                "COPY venta_staging (linea, id_producto, id_cliente, fecha, cantidad, estado) FROM STDIN"
+            ) as copy:
+                for row in rows:
+                    await copy.write_row(row)
+
+            await cur.execute(
                 """
+                SELECT s.linea,
+                       CASE WHEN p.id_producto IS NULL THEN 'Producto no encontrado'
+                            WHEN c.id_cliente IS NULL THEN 'Cliente no encontrado'
+                            ELSE 'Producto sin precio unitario' END
+                FROM venta_staging s
+                LEFT JOIN producto p ON p.id_producto = s.id_producto
+                LEFT JOIN cliente  c ON c.id_cliente  = s.id_cliente
+                WHERE p.id_producto IS NULL OR c.id_cliente IS NULL OR p.precio_unitario IS NULL
+                ORDER BY s.linea
+                """
+            )
+            errores = await cur.fetchall()
+            if solo_validar or (errores and not parcial):
+                return 0, errores
+
+            await cur.execute(
+                """
+                INSERT INTO venta (id_producto, id_cliente, fecha, cantidad, importe_total, estado)
+                SELECT s.id_producto,
+                       s.id_cliente,
+                       COALESCE(s.fecha, CURRENT_DATE),
+                       s.cantidad,
+                       round(p.precio_unitario::numeric * s.cantidad, 2),
+                       COALESCE(s.estado, 1)
+                FROM venta_staging s
+                JOIN producto p ON p.id_producto = s.id_producto
+                JOIN cliente  c ON c.id_cliente  = s.id_cliente
+                WHERE p.precio_unitario IS NOT NULL
+                ORDER BY s.linea
+                """
+            )
+            return cur.rowcount, errores
+
+    # ----------------- ANALÍTICA (rollup venta_mensual) -----------------
+    async def read_monthly_totals(self, desde, hasta):
+        """
+        Totales por producto y mes (ventas activas) para los meses en [desde, hasta).
+        Lee el rollup venta_mensual: (id_producto, mes, cantidad, importe_total).
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT id_producto,
+                       mes,
+                       cantidad::float,
+                       importe_total::float
+                FROM venta_mensual
+                WHERE mes >= %s
+                  AND mes <  %s
+                """,
+                (desde, hasta),
+            )
+            return await cur.fetchall()
+
+    async def read_precheck(self, desde, hasta):
+        """
+        Devuelve (hay_productos, hay_ventas, hay_ventas_en_ventana) en una sola consulta.
+        Mira 'venta' (cualquier estado), no el rollup: venta_mensual solo tiene ventas activas.
+        Los EXISTS son baratos con idx_venta_fecha_id (sql/001).
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT EXISTS (SELECT 1 FROM producto),
+                       EXISTS (SELECT 1 FROM venta),
+                       EXISTS (SELECT 1 FROM venta WHERE fecha >= %s AND fecha < %s)
+                """,
+                (desde, hasta),
+            )
+            return await cur.fetchone()
+
+    async def rebuild_venta_mensual(self) -> int:
+        """
+        Reconstruye venta_mensual desde cero (backfill). Bloquea escrituras en venta
+        mientras dura para que los triggers no se crucen con la reconstrucción.
+        """
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute("LOCK TABLE venta IN SHARE MODE")
+            await cur.execute("DELETE FROM venta_mensual")
+            await cur.execute(
+                """
+                INSERT INTO venta_mensual (id_producto, mes, cantidad, importe_total, n_ventas)
+                SELECT id_producto,
+                       date_trunc('month', fecha)::date,
+                       SUM(cantidad),
+                       SUM(COALESCE(importe_total, 0)),
+                       COUNT(*)
+                FROM venta
+                WHERE estado = 1 AND fecha IS NOT NULL
+                GROUP BY 1, 2
+                """
+            )
+            return cur.rowcount
+
+    # ----------------- DASHBOARD -----------------
+    async def read_venta_view_page(self, limit: int, after=None, **filtros):
+        """
+        Ventas con nombres de cliente y producto, paginadas por keyset (fecha DESC, id_venta DESC) y filtradas.
+        """
+        where, params = self._where_listado(filtros, after, alias="v")
+        async with connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                f"""
                 SELECT
                     v.id_venta,
                     v.id_producto,
@@ -130,14 +281,44 @@ class VentaConnection:
                 FROM venta v
                 JOIN producto p ON p.id_producto = v.id_producto
                 JOIN cliente  c ON c.id_cliente  = v.id_cliente
-                ORDER BY v.fecha DESC, v.id_venta DESC
-                """
+                {where}
+                ORDER BY {_orden_fecha("v.")} DESC, v.id_venta DESC
+                LIMIT %(limit)s
+                """,
+                {**params, "limit": limit},
+            )
+            return await cur.fetchall()
+
+    # ----------------- EXPORTACIÓN -----------------
+    async def stream_venta_view(self, batch_size: int, **filtros):
+        """
+        Recorre las ventas (con nombres de producto y cliente) con un cursor del lado
+        del servidor y las entrega en lotes de batch_size filas, sin cargar la tabla en memoria.
+        """
+        where, params = self._where_listado(filtros, alias="v")
+        async with connection() as conn, conn.cursor(name="exportar_venta") as cur:
+            await cur.execute(
+                f"""
+                SELECT
+                    v.id_venta,
+                    v.id_producto,
+                    p.nombre_producto,
+                    v.id_cliente,
+                    c.nombre_empresa AS cliente_nombre,
+                    v.fecha,
+                    v.cantidad,
+                    v.importe_total,
+                    v.estado
+                FROM venta v
+                JOIN producto p ON p.id_producto = v.id_producto
+                JOIN cliente  c ON c.id_cliente  = v.id_cliente
+                {where}
+                ORDER BY {_orden_fecha("v.")} DESC, v.id_venta DESC
+                """,
+                params,
             )
-            return cur.fetchall()
-
-    def __del__(self):
-        if getattr(self, "conn", None):
-            try:
-                self.conn.close()
-            except Exception:
-                pass
\ No newline at end of file
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
@@ -42,6 +42,16 @@ def last_12_month_keys(today: Optional[date] = None) -> List[str]:
 def month_key_from_date(d: date | datetime) -> str:
     return f"{d.year}-{d.month:02d}"
 
+def month_window_from_keys(keys: List[str]) -> tuple[date, date]:
+    """
+    Rango [desde, hasta) de fechas que cubren los meses 'YYYY-MM' de keys (ordenados).
+    Ej: ['2025-01', ..., '2025-12'] -> (2025-01-01, 2026-01-01)
+    """
+    y0, m0 = int(keys[0][:4]), int(keys[0][5:7])
+    y1, m1 = int(keys[-1][:4]), int(keys[-1][5:7])
+    y1, m1 = (y1 + 1, 1) if m1 == 12 else (y1, m1 + 1)
+    return date(y0, m0, 1), date(y1, m1, 1)
+
 def abc_label_from_cumshare(cum_share: float, a_cut: float, b_cut: float) -> str:
     if cum_share <= a_cut:
         return "A"
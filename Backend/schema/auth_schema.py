@@ -1,6 +1,14 @@
 # schema/auth_schema.py
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class LoginSchema(BaseModel):
     usuario: str
-    contrasenia: str
\ No newline at end of file
+    contrasenia: str
+
+class Principal(BaseModel):
+    """Usuario autenticado, tal como viene en el JWT (roles en minúsculas)."""
+    id_usuario: Optional[int] = None
+    usuario: Optional[str] = None
+    roles: List[str] = []
\ No newline at end of file
@@ -0,0 +1,26 @@
+# schema/job_schema.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+class JobInfo(BaseModel):
+    """
+    Estado de un trabajo en segundo plano.
+    resultado indica dónde quedó guardado: {"id_run": ...} (forecast) o {"id_resultado": ...} (ABC-XYZ).
+    """
+    id_job: int
+    tipo: str
+    estado: str                      # pendiente | en_curso | ok | error
+    progreso: float                  # 0..1
+    mensaje: Optional[str] = None
+    resultado: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    intentos: int = 0
+    creado_en: datetime
+    iniciado_en: Optional[datetime] = None
+    actualizado_en: datetime
+    terminado_en: Optional[datetime] = None
@@ -42,6 +42,27 @@ class ForecastRequest(BaseModel):
     items: List[ForecastItem]
 
 
+class ForecastHorizonRequest(BaseModel):
+    """
+    Forecast recursivo multi-horizonte (productos de la BD):
+    el servidor avanza mes a mes y cada predicción pasa a ser el lag_1 (y el pct_chg_1)
+    del mes siguiente.
+    """
+    id_productos: Optional[List[int]] = Field(
+        default=None,
+        description="Productos a proyectar (None -> todo el catálogo)",
+    )
+    fecha_inicio: Optional[date] = Field(
+        default=None,
+        description="Primer mes a predecir (por defecto, el mes siguiente al actual)",
+    )
+    horizonte: int = Field(default=12, ge=1, le=36, description="Cantidad de meses a proyectar")
+    pct_chg_1: float | None = Field(
+        default=None,
+        description="pct_chg_1 del primer mes para todos los productos (None -> se calcula por producto desde lag_1/lag_2)",
+    )
+
+
 class ForecastResponseItem(BaseModel):
     id_producto: int
     producto: str
@@ -59,6 +80,27 @@ class ForecastRunInfo(BaseModel):
     periodo_fin: date
     horizonte_meses: int
 
+    # Agregados calculados en SQL (listado paginado)
+    items: Optional[int] = None
+    total_predicho: Optional[float] = None
+
+
+class ForecastCategoriaResumen(BaseModel):
+    categoria_abcxyz: Optional[str] = None   # None -> filas sin categoría
+    items: int
+    productos: int
+    total_predicho: float
+    total_baseline: float
+
+
+class ForecastRunResumen(BaseModel):
+    id_run: int
+    items: int
+    productos: int
+    total_predicho: float
+    total_baseline: float
+    por_categoria: List[ForecastCategoriaResumen]
+
 
 class ForecastHistoryDetail(BaseModel):
     id_detalle: int
@@ -0,0 +1,25 @@
+# scripts/backfill_venta_mensual.py
+"""
+Reconstruye la tabla venta_mensual a partir de 'venta'.
+Uso (desde Backend/):  python -m scripts.backfill_venta_mensual
+"""
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.database import close_pool
+from model.venta_connection import VentaConnection
+
+
+async def main():
+    try:
+        n = await VentaConnection().rebuild_venta_mensual()
+        print(f"✅ venta_mensual reconstruida: {n} filas (producto x mes)")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+# scripts/migrar_contrasenias.py
+"""
+Convierte a bcrypt las contraseñas que todavía estén guardadas en texto plano.
+(El login ya las migra de a una en el primer ingreso; esto cubre las cuentas que no entran.)
+Uso (desde Backend/):  python -m scripts.migrar_contrasenias
+"""
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.database import close_pool
+from config.passwords import PWD_HASHER
+from model.usuario_connection import UsuarioConnection
+
+
+async def main():
+    uconn = UsuarioConnection()
+    try:
+        pendientes = [(r[0], r[5]) for r in await uconn.read_usuario() if r[5] and not PWD_HASHER.es_hash(r[5])]
+        migradas = 0
+        for id_usuario, plano in pendientes:
+            if await uconn.update_contrasenia(id_usuario, await PWD_HASHER.hash(plano), plano):
+                migradas += 1
+        print(f"✅ Contraseñas migradas a bcrypt: {migradas} de {len(pendientes)} en texto plano")
+    finally:
+        PWD_HASHER.shutdown()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
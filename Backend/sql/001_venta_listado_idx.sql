@@ -0,0 +1,18 @@
+-- sql/001_venta_listado_idx.sql
+-- Índices para los listados de ventas paginados por keyset y sus filtros más comunes.
+-- El orden es (COALESCE(fecha, '-infinity') DESC, id_venta DESC): las ventas sin fecha quedan
+-- al final y se alcanzan con la misma comparación de filas (ver model/venta_connection.py).
+
+-- Versión anterior de este script: índices sobre fecha sin COALESCE
+DROP INDEX IF EXISTS idx_venta_fecha_id;
+DROP INDEX IF EXISTS idx_venta_producto_fecha_id;
+DROP INDEX IF EXISTS idx_venta_cliente_fecha_id;
+
+CREATE INDEX IF NOT EXISTS idx_venta_orden_id
+    ON venta ((COALESCE(fecha, '-infinity'::date)) DESC, id_venta DESC);
+
+CREATE INDEX IF NOT EXISTS idx_venta_producto_orden_id
+    ON venta (id_producto, (COALESCE(fecha, '-infinity'::date)) DESC, id_venta DESC);
+
+CREATE INDEX IF NOT EXISTS idx_venta_cliente_orden_id
+    ON venta (id_cliente, (COALESCE(fecha, '-infinity'::date)) DESC, id_venta DESC);
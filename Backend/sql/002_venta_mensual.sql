@@ -0,0 +1,98 @@
+-- sql/002_venta_mensual.sql
+-- Rollup mensual de ventas activas (estado = 1) por producto.
+-- Lo mantienen triggers sobre 'venta' en la misma transacción que cada INSERT/UPDATE/DELETE/TRUNCATE.
+-- Después de crearlo, llenarlo con:  python -m scripts.backfill_venta_mensual
+
+CREATE TABLE IF NOT EXISTS venta_mensual (
+    id_producto   integer NOT NULL,
+    mes           date    NOT NULL,             -- primer día del mes
+    cantidad      bigint  NOT NULL DEFAULT 0,
+    importe_total numeric NOT NULL DEFAULT 0,
+    n_ventas      integer NOT NULL DEFAULT 0,   -- ventas activas que aportan a la fila
+    PRIMARY KEY (id_producto, mes)
+);
+
+CREATE INDEX IF NOT EXISTS idx_venta_mensual_mes ON venta_mensual (mes);
+
+-- Aplica el delta de las filas afectadas por la sentencia (tablas de transición):
+-- suma las filas nuevas, resta las viejas y borra los meses que se quedan sin ventas.
+CREATE OR REPLACE FUNCTION venta_mensual_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO venta_mensual AS vm (id_producto, mes, cantidad, importe_total, n_ventas)
+        SELECT id_producto,
+               date_trunc('month', fecha)::date,
+               SUM(cantidad),
+               SUM(COALESCE(importe_total, 0)),
+               COUNT(*)
+        FROM nuevas
+        WHERE estado = 1 AND fecha IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (id_producto, mes) DO UPDATE
+            SET cantidad      = vm.cantidad      + EXCLUDED.cantidad,
+                importe_total = vm.importe_total + EXCLUDED.importe_total,
+                n_ventas      = vm.n_ventas      + EXCLUDED.n_ventas;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE venta_mensual vm
+           SET cantidad      = vm.cantidad      - d.cantidad,
+               importe_total = vm.importe_total - d.importe_total,
+               n_ventas      = vm.n_ventas      - d.n_ventas
+          FROM (
+                SELECT id_producto,
+                       date_trunc('month', fecha)::date AS mes,
+                       SUM(cantidad)                    AS cantidad,
+                       SUM(COALESCE(importe_total, 0))  AS importe_total,
+                       COUNT(*)                         AS n_ventas
+                FROM viejas
+                WHERE estado = 1 AND fecha IS NOT NULL
+                GROUP BY 1, 2
+          ) d
+         WHERE vm.id_producto = d.id_producto
+           AND vm.mes = d.mes;
+
+        DELETE FROM venta_mensual vm
+         USING (SELECT DISTINCT id_producto, date_trunc('month', fecha)::date AS mes FROM viejas) d
+         WHERE vm.id_producto = d.id_producto
+           AND vm.mes = d.mes
+           AND vm.n_ventas <= 0;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_venta_mensual_ins ON venta;
+DROP TRIGGER IF EXISTS trg_venta_mensual_upd ON venta;
+DROP TRIGGER IF EXISTS trg_venta_mensual_del ON venta;
+DROP TRIGGER IF EXISTS trg_venta_mensual_trunc ON venta;
+
+CREATE TRIGGER trg_venta_mensual_ins
+    AFTER INSERT ON venta
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION venta_mensual_sync();
+
+CREATE TRIGGER trg_venta_mensual_upd
+    AFTER UPDATE ON venta
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION venta_mensual_sync();
+
+CREATE TRIGGER trg_venta_mensual_del
+    AFTER DELETE ON venta
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION venta_mensual_sync();
+
+-- TRUNCATE no dispara los triggers de DELETE (ni tiene tablas de transición): vacía el rollup entero
+CREATE OR REPLACE FUNCTION venta_mensual_truncar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE venta_mensual;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_venta_mensual_trunc
+    AFTER TRUNCATE ON venta
+    FOR EACH STATEMENT EXECUTE FUNCTION venta_mensual_truncar();
@@ -0,0 +1,18 @@
+-- sql/003_abcxyz_resultado.sql
+-- Resultados de los análisis ABC-XYZ (desde BD o desde archivo), compartidos por todos los workers.
+-- payload = JSON compacto comprimido con zlib (ver model/abcxyz_connection.py).
+
+CREATE TABLE IF NOT EXISTS abcxyz_resultado (
+    id_resultado  bigserial   PRIMARY KEY,
+    fuente        varchar(10) NOT NULL CHECK (fuente IN ('db', 'excel')),
+    creado_en     timestamptz NOT NULL DEFAULT now(),
+    n_items       integer     NOT NULL DEFAULT 0,
+    payload       bytea       NOT NULL
+);
+
+-- "último análisis por fuente" y "último análisis" se resuelven con un solo recorrido de índice
+CREATE INDEX IF NOT EXISTS idx_abcxyz_resultado_fuente_creado
+    ON abcxyz_resultado (fuente, creado_en DESC, id_resultado DESC);
+
+CREATE INDEX IF NOT EXISTS idx_abcxyz_resultado_creado
+    ON abcxyz_resultado (creado_en DESC, id_resultado DESC);
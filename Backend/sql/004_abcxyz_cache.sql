@@ -0,0 +1,75 @@
+-- sql/004_abcxyz_cache.sql
+-- Caché de /api/abcxyz/run: un resultado se reutiliza mientras no cambien la configuración,
+-- la ventana de 12 meses ni los datos (venta / venta_mensual / producto).
+--
+-- La versión de datos NO es una fila única que cada escritura actualiza: esa fila quedaría bloqueada
+-- hasta el commit y serializaría a todos los que escriben ventas (incluida la carga masiva).
+-- En su lugar, un trigger por sentencia INSERTA una fila en abcxyz_cambio (los INSERT no compiten
+-- entre sí) y la versión es:
+--     abcxyz_version.compactados + (filas visibles en abcxyz_cambio)
+-- Una fila nueva solo se ve tras el commit, así que la versión sube exactamente cuando los datos
+-- cambiados se vuelven visibles. (max(id) no sirve: una transacción con un id menor puede
+-- hacer commit después de otra con un id mayor.)
+-- Para que el conteo siga siendo barato, abcxyz_compactar() pasa las filas del log al contador
+-- en una sola transacción (lo llama model/abcxyz_connection.py al leer, no las escrituras).
+
+CREATE TABLE IF NOT EXISTS abcxyz_cambio (
+    id_cambio  bigserial   PRIMARY KEY,
+    creado_en  timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS abcxyz_version (
+    id          boolean PRIMARY KEY DEFAULT true CHECK (id),   -- una sola fila
+    compactados bigint  NOT NULL DEFAULT 0
+);
+
+-- Instalaciones con la versión anterior de este script (contador 'version' actualizado por trigger)
+ALTER TABLE abcxyz_version ADD COLUMN IF NOT EXISTS compactados bigint NOT NULL DEFAULT 0;
+ALTER TABLE abcxyz_version DROP COLUMN IF EXISTS version;
+
+INSERT INTO abcxyz_version (id, compactados) VALUES (true, 0)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION abcxyz_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO abcxyz_cambio DEFAULT VALUES;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION abcxyz_compactar() RETURNS bigint
+LANGUAGE sql AS $$
+    WITH borrados AS (
+        DELETE FROM abcxyz_cambio RETURNING 1
+    )
+    UPDATE abcxyz_version
+       SET compactados = compactados + (SELECT COUNT(*) FROM borrados)
+     WHERE id
+    RETURNING compactados;
+$$;
+
+DROP TRIGGER IF EXISTS trg_abcxyz_version_venta ON venta;
+DROP TRIGGER IF EXISTS trg_abcxyz_version_venta_mensual ON venta_mensual;
+DROP TRIGGER IF EXISTS trg_abcxyz_version_producto ON producto;
+
+CREATE TRIGGER trg_abcxyz_version_venta
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON venta
+    FOR EACH STATEMENT EXECUTE FUNCTION abcxyz_version_bump();
+
+-- venta_mensual es la fuente del ABC-XYZ: además de los triggers de venta (sql/002) la escriben
+-- el backfill y las reparaciones manuales, que también tienen que invalidar la caché
+CREATE TRIGGER trg_abcxyz_version_venta_mensual
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON venta_mensual
+    FOR EACH STATEMENT EXECUTE FUNCTION abcxyz_version_bump();
+
+CREATE TRIGGER trg_abcxyz_version_producto
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON producto
+    FOR EACH STATEMENT EXECUTE FUNCTION abcxyz_version_bump();
+
+-- Clave de caché del resultado: config + ventana + versión de datos (ver main.py)
+ALTER TABLE abcxyz_resultado ADD COLUMN IF NOT EXISTS cache_key text;
+
+CREATE INDEX IF NOT EXISTS idx_abcxyz_resultado_cache_key
+    ON abcxyz_resultado (fuente, cache_key, id_resultado DESC)
+    WHERE cache_key IS NOT NULL;
@@ -0,0 +1,30 @@
+-- sql/005_job.sql
+-- Cola de trabajos en segundo plano (forecast y ABC-XYZ de catálogo completo).
+-- Los workers toman trabajos con FOR UPDATE SKIP LOCKED, así varios procesos de uvicorn
+-- pueden compartir la misma cola sin tomar dos veces el mismo trabajo.
+--
+-- estado: pendiente -> en_curso -> ok | error
+-- resultado: referencia a donde quedó guardado ({"id_run": ...} o {"id_resultado": ...})
+
+CREATE TABLE IF NOT EXISTS job (
+    id_job         bigserial   PRIMARY KEY,
+    tipo           varchar(30) NOT NULL
+                   CHECK (tipo IN ('forecast_xgb', 'forecast_horizonte', 'abcxyz_run')),
+    estado         varchar(10) NOT NULL DEFAULT 'pendiente'
+                   CHECK (estado IN ('pendiente', 'en_curso', 'ok', 'error')),
+    parametros     jsonb       NOT NULL DEFAULT '{}'::jsonb,
+    progreso       real        NOT NULL DEFAULT 0,
+    mensaje        text,
+    resultado      jsonb,
+    error          text,
+    intentos       integer     NOT NULL DEFAULT 0,
+    creado_en      timestamptz NOT NULL DEFAULT now(),
+    iniciado_en    timestamptz,
+    actualizado_en timestamptz NOT NULL DEFAULT now(),
+    terminado_en   timestamptz
+);
+
+-- Trabajos por tomar (pendientes o en curso con el worker caído), en orden de llegada
+CREATE INDEX IF NOT EXISTS idx_job_cola
+    ON job (id_job)
+    WHERE estado IN ('pendiente', 'en_curso');
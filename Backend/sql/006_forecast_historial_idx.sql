@@ -0,0 +1,11 @@
+-- sql/006_forecast_historial_idx.sql
+-- Índices para el historial de forecast paginado: detalle de una corrida (el índice acota
+-- la corrida y el mes; el orden por nombre de producto lo resuelve un sort sobre esas filas),
+-- filtros por producto y resúmenes por corrida.
+-- (forecast_run se pagina por id_run DESC con su clave primaria.)
+
+CREATE INDEX IF NOT EXISTS idx_forecast_detalle_run_fecha_id
+    ON forecast_detalle (id_run, fecha_mes, id_detalle);
+
+CREATE INDEX IF NOT EXISTS idx_forecast_detalle_run_producto
+    ON forecast_detalle (id_run, id_producto, fecha_mes, id_detalle);
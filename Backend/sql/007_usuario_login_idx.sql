@@ -0,0 +1,9 @@
+-- sql/007_usuario_login_idx.sql
+-- Índices del login: búsqueda por LOWER(usuario) (la misma expresión del WHERE, si no
+-- PostgreSQL no puede usar un índice sobre 'usuario') y roles por usuario para el array_agg.
+
+CREATE INDEX IF NOT EXISTS idx_usuario_lower_usuario
+    ON usuario (LOWER(usuario));
+
+CREATE INDEX IF NOT EXISTS idx_tipo_usuario_usuario
+    ON tipo_usuario (id_usuario, id_tipousuario);
@@ -0,0 +1,17 @@
+-- sql/008_usuario_unico.sql
+-- Usuario y correo únicos sin distinguir mayúsculas: el alta de usuarios ya no consulta
+-- duplicados antes de insertar (carrera entre registros simultáneos), los rechaza el índice.
+-- model/usuario_connection.py reconoce cada índice por su nombre (mensaje 409): no renombrarlos.
+--
+-- Si ya hay duplicados, CREATE UNIQUE INDEX falla. Para encontrarlos:
+--   SELECT LOWER(usuario), array_agg(id) FROM usuario GROUP BY 1 HAVING COUNT(*) > 1;
+--   SELECT LOWER(correo),  array_agg(id) FROM usuario GROUP BY 1 HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_usuario_lower_usuario
+    ON usuario (LOWER(usuario));
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_usuario_lower_correo
+    ON usuario (LOWER(correo));
+
+-- El índice único también sirve al login (sql/007): el no único queda de más
+DROP INDEX IF EXISTS idx_usuario_lower_usuario;
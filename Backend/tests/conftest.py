@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# Los módulos se importan como en la API (main.py corre desde Backend/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
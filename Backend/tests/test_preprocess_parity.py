@@ -0,0 +1,33 @@
+# tests/test_preprocess_parity.py
+"""
+Paridad del preprocess compilado (ml/preprocess_compiled.py) contra el preprocess.pkl
+de scikit-learn. Al importar runtime_xgb solo se verifica una semilla; acá se cubren varias
+con lotes más grandes.
+
+Desde Backend/:  python -m pytest tests
+"""
+import pytest
+
+from ml.preprocess_compiled import (
+    PARITY_ATOL,
+    CompiledPreprocess,
+    check_parity,
+    compile_preprocess,
+)
+from ml.runtime_xgb import NUM_COLUMNS, PREPROCESS
+
+
+@pytest.fixture(scope="module")
+def compiled():
+    return CompiledPreprocess(PREPROCESS, NUM_COLUMNS)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_paridad_con_scikit_learn(compiled, seed):
+    diff = check_parity(compiled, PREPROCESS, n=2000, seed=seed)
+    assert diff <= PARITY_ATOL, f"seed={seed} max|diff|={diff:g}"
+
+
+def test_pipeline_no_soportado_no_lanza():
+    # Al importar runtime_xgb un pipeline no soportado solo avisa y se usa scikit-learn
+    assert compile_preprocess(object(), NUM_COLUMNS) is None